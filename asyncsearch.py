@@ -0,0 +1,127 @@
+import asyncio
+from nextgen import Op, iterate_next, cipher_ctx, get_fragments, clear_memos
+
+# asyncio API of the search, for interactive use. The search runs as a
+# task in the event loop, giving control back every pause nodes, and puts
+# its results in a bounded queue: when the consumer falls behind, the queue
+# fills up and the search waits for it. The memo tables of the search are
+# module globals, cleared as each search starts, so run one search at a
+# time.
+
+PAUSE_NODES = 1000
+QUEUE_SIZE = 64
+
+DONE = object()
+
+class SearchResults:
+    """
+    Async iterator of the (pkc, hdr) results of iterate_next(op, ctx, md).
+    The search stops after max_results results or time_budget seconds,
+    whichever comes first; timed_out tells if the time budget ran out.
+    Closing the iterator, or cancelling the task iterating it, cancels the
+    search. It is also an async context manager that closes it on exit:
+
+        async with find_cipher(args, md, max_results=10) as results:
+            async for pkc, hdr in results:
+                ...
+    """
+    def __init__(self, op, ctx, md, max_results=None, time_budget=None,
+                 queue_size=QUEUE_SIZE, pause=PAUSE_NODES):
+        self.op = op
+        self.ctx = ctx
+        self.md = md
+        self.max_results = max_results
+        self.time_budget = time_budget
+        self.pause = pause
+        self.queue = asyncio.Queue(queue_size)
+        self.task = None
+        self.closed = False
+        self.count = 0
+        self.timed_out = False
+
+    async def search(self):
+        loop = asyncio.get_running_loop()
+        deadline = None if self.time_budget is None else loop.time() + self.time_budget
+        clear_memos()
+        try:
+            for result in iterate_next(self.op, self.ctx, self.md, self.pause):
+                if deadline is not None and loop.time() >= deadline:
+                    self.timed_out = True
+                    break
+                if result is None:
+                    await asyncio.sleep(0)
+                    continue
+                await self.queue.put(result)
+                self.count += 1
+                if self.max_results is not None and self.count >= self.max_results:
+                    break
+        except Exception as e:
+            await self.queue.put(e)
+            return
+        await self.queue.put(DONE)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration
+        if self.task is None:
+            self.task = asyncio.create_task(self.search())
+        try:
+            result = await self.queue.get()
+        except asyncio.CancelledError:
+            await self.aclose()
+            raise
+        if result is DONE:
+            self.closed = True
+            raise StopAsyncIteration
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def aclose(self):
+        self.closed = True
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+def find_cipher(args, md, **kwargs):
+    # find --cipher for the nextgen args, as SearchResults
+    return SearchResults(Op.KEY_WORDS, cipher_ctx(args, get_fragments(args)), md, **kwargs)
+
+"""
+-c xzfdq --mk 6: 0 results
+-c xzfdq --mk 3: 4 results, 4 alone
+"""
+def test_sequential_searches(args, md):
+    # a search after another one with a different min_keylen finds what it
+    # finds alone
+    async def count(md):
+        async with find_cipher(args, md) as results:
+            return len([result async for result in results])
+
+    async def run():
+        first = await count(md._replace(min_keylen=6))
+        second = await count(md._replace(min_keylen=3))
+        alone = await count(md._replace(min_keylen=3))
+        print(f"-c {args.cipher} --mk 6: {first} results")
+        print(f"-c {args.cipher} --mk 3: {second} results, {alone} alone")
+
+    asyncio.run(run())
+
+# Example usage: python asyncsearch.py -d <dict> -c xzfdq
+if __name__ == "__main__":
+    from util import parse_args
+    from nextgen import md_init
+    args = parse_args()
+    test_sequential_searches(args, md_init(args))
@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import redirect_stdout
+from itertools import islice
+from types import SimpleNamespace
+import nextgen
+from brute import find_solutions
+from ciphergen import generate_ciphers_for_key
+from codec import decode_with_key, native
+from context import Context
+from nextgen import Metadata, Op, get_fragments, generate_next, iterate_next, clear_memos
+from util import load_wordlist, join
+from wordgen import make_words, generate_key_words, generate_words, contains_words_and_word_prefix, native_mismatches
+
+# Benchmarks of the core generators on fixed workloads. Each workload is a
+# dictionary, a fragment set and the inputs derived from them; inputs are
+# generated with a fixed seed so runs are comparable. Results can be saved
+# as a baseline JSON and later runs compared against it. Large dictionaries
+# have far too many results to enumerate, so at most --limit results are
+# taken per input, and find stops after --nodes nodes.
+#
+# The deep workloads, one per --depths fragment count, are a chain of
+# single letter fragments whose results are found as deep as the fragments
+# go; results and results_recursive show the cost per result of the search
+# engines as the depth grows.
+#
+# When the native module is built, each workload's feasibility texts are
+# also checked against it, and any difference from the Python results
+# fails the run, as a regression does.
+
+Workload = namedtuple('Workload', ['name', 'md', 'fragments', 'cipher', 'plains', 'keys', 'texts'])
+Result = namedtuple('Result', ['count', 'unit', 'seconds', 'peak_kb'])
+
+TEST_FRAGMENTS = ['qvu', 'bma', 'aps', 'e', 'tn', 'nc', 'sc', 'ngqzp']
+TEST_WORDLIST = ["balls", "boobs", "bon", "bonfire", "bucket", "fire", "fiber",
+                 "fifteen", "epic", "snow", "soybean", "soy", "sir", "sire", "spy", "key"]
+# key words of b's decode the cipher, and of c's the fragments, to a's
+DEEP_WORDLIST = [letter * length for letter in "abc" for length in range(1, 4)]
+DEEP_CIPHER = "bb"
+
+# English letter frequencies, so generated words branch like real ones
+LETTER_WEIGHTS = {
+    'a': 8.2, 'b': 1.5, 'c': 2.8, 'd': 4.3, 'e': 12.7, 'f': 2.2, 'g': 2.0, 'h': 6.1,
+    'i': 7.0, 'j': 0.2, 'k': 0.8, 'l': 4.0, 'm': 2.4, 'n': 6.7, 'o': 7.5, 'p': 1.9,
+    'q': 0.1, 'r': 6.0, 's': 6.3, 't': 9.1, 'u': 2.8, 'v': 1.0, 'w': 2.4, 'x': 0.2,
+    'y': 2.0, 'z': 0.1
+}
+SEED = 20240917
+NUM_INPUTS = 20
+
+def synthetic_wordlist(num_words, seed=SEED):
+    rng = random.Random(seed)
+    letters = list(LETTER_WEIGHTS)
+    weights = list(LETTER_WEIGHTS.values())
+    words = set()
+    while len(words) < num_words:
+        length = rng.choice([3, 4, 4, 5, 5, 5, 6, 6, 6, 7, 7, 8, 8, 9, 10, 11, 12])
+        words.add(''.join(rng.choices(letters, weights, k=length)))
+    return sorted(words)
+
+def make_workload(name, wordlist, fragments, cipher, min_keylen, seed=SEED):
+    words = make_words(wordlist)
+    md = Metadata(words=words, keywords=words, verbose=False, min_keylen=min_keylen)
+    rng = random.Random(seed)
+    # plaintexts are runs of dictionary words ending in a word prefix; keys
+    # are dictionary words of at least min_keylen letters
+    plains = []
+    for _ in range(NUM_INPUTS):
+        run = [rng.choice(wordlist) for _ in range(3)]
+        plains.append(join(run) + rng.choice(wordlist)[:2])
+    key_words = [word for word in wordlist if len(word) >= min_keylen]
+    keys = [join(rng.sample(key_words, 2)) for _ in range(NUM_INPUTS)]
+    # feasibility texts: every prefix of the plaintexts, and the cipher
+    # decoded with each key word, most of which are infeasible
+    texts = [plain[:i] for plain in plains for i in range(1, len(plain) + 1)]
+    texts += [decode_with_key(cipher, word) for word in rng.sample(key_words, min(len(key_words), 1000))]
+    return Workload(name=name, md=md, fragments=fragments, cipher=cipher, plains=plains, keys=keys, texts=texts)
+
+class NodeLimit(Exception):
+    pass
+
+def count(generator, args):
+    return sum(1 for _ in islice(generator, args.limit))
+
+def bench_words(wl, args):
+    return sum(count(generate_words(Context(plaintext=plain), wl.md.words), args)
+               for plain in wl.plains), "partitions"
+
+def bench_feasible(wl, args):
+    words = wl.md.words
+    for text in wl.texts:
+        contains_words_and_word_prefix(text, words)
+    return len(wl.texts), "calls"
+
+def bench_feasible_partitions(wl, args):
+    # the feasibility check as the first partition from generate_words, for
+    # comparison with bench_feasible
+    words = wl.md.words
+    for text in wl.texts:
+        next(generate_words(Context(plaintext=text), words), None)
+    return len(wl.texts), "calls"
+
+def bench_key_words(wl, args):
+    # key word sequences covering each cipher prefix
+    ciphers = dict.fromkeys(wl.cipher[:length] for length in args.lengths)
+    return sum(count(generate_key_words(Context(cipher=cipher, fragments=wl.fragments), wl.md), args)
+               for cipher in ciphers), "keys"
+
+def bench_ciphers_for_key(wl, args):
+    return sum(count(generate_ciphers_for_key(Context(key=key, fragments=wl.fragments), wl.md), args)
+               for key in wl.keys), "ciphers"
+
+def run_find(search, wl, args):
+    # find --cipher, counting the nodes generated by every op; most key word
+    # candidates are rejected without expanding an op, so they are counted
+    # as nodes too. Returns the nodes and the results found within
+    # args.nodes nodes.
+    nodes = 0
+    results = 0
+
+    def counted(func):
+        def wrapper(*args_, **kwargs):
+            nonlocal nodes
+            generator = func(*args_, **kwargs)
+            value = None
+            while True:
+                if nodes >= args.nodes:
+                    raise NodeLimit()
+                try:
+                    item = generator.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                nodes += 1
+                value = yield item
+        return wrapper
+
+    saved = {name: getattr(nextgen, name) for name in nextgen.OP_GENERATORS.values()}
+    for name, func in saved.items():
+        setattr(nextgen, name, counted(func))
+    try:
+        ctx = Context(cipher=wl.cipher[:args.find_length], key_words=[],
+                      fragments=[frag for frag in wl.fragments if frag not in wl.cipher])
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            for _ in islice(search(Op.KEY_WORDS, ctx, wl.md), args.limit):
+                results += 1
+    except NodeLimit:
+        pass
+    finally:
+        for name, func in saved.items():
+            setattr(nextgen, name, func)
+    return nodes, results
+
+def bench_find(wl, args):
+    return run_find(iterate_next, wl, args)[0], "nodes"
+
+def bench_results(wl, args):
+    return run_find(iterate_next, wl, args)[1], "results"
+
+def bench_results_recursive(wl, args):
+    return run_find(generate_next, wl, args)[1], "results"
+
+def bench_brute(wl, args):
+    brute_args = SimpleNamespace(length=args.brute_length, key_prefix=None, plain_prefix=None, show_all=False)
+    find_solutions(wl.cipher, wl.md.words.set, brute_args, set())
+    return len(wl.md.words.set), "words"
+
+BENCHMARKS = {
+    'words': bench_words,
+    'feasible': bench_feasible,
+    'feasible_partitions': bench_feasible_partitions,
+    'key_words': bench_key_words,
+    'ciphers_for_key': bench_ciphers_for_key,
+    'find': bench_find,
+    'results': bench_results,
+    'results_recursive': bench_results_recursive,
+    'brute': bench_brute
+}
+
+def run_bench(func, wl, args):
+    # best of args.repeat timed runs, then one run under tracemalloc for the
+    # peak memory
+    seconds = None
+    for _ in range(args.repeat):
+        clear_memos()
+        start = time.perf_counter()
+        count, unit = func(wl, args)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    peak_kb = None
+    if not args.nm:
+        clear_memos()
+        tracemalloc.start()
+        func(wl, args)
+        peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return Result(count=count, unit=unit, seconds=seconds, peak_kb=peak_kb)
+
+def rate(result):
+    return result.count / result.seconds if result.seconds else 0.0
+
+def print_result(workload, name, result, base=None):
+    line = f"{workload:<10} {name:<20} {result.count:>9} {result.unit:<10} {result.seconds:>8.3f}s " \
+           f"{rate(result):>12.0f} {result.unit}/s"
+    if result.peak_kb is not None:
+        line += f" {result.peak_kb:>8} KB"
+    if base:
+        base_rate = base['count'] / base['seconds'] if base['seconds'] else 0.0
+        if base['count'] != result.count:
+            line += f"  count changed: {base['count']}"
+        elif base_rate:
+            line += f"  x{rate(result) / base_rate:.2f}"
+    print(line)
+
+def regressed(result, base, tolerance):
+    if not base or not base['seconds'] or not result.seconds:
+        return False
+    return rate(result) < (base['count'] / base['seconds']) * (1 - tolerance)
+
+def load_workloads(args):
+    workloads = []
+    if 'small' in args.workloads:
+        workloads.append(make_workload('small', sorted(TEST_WORDLIST), TEST_FRAGMENTS, "xzfdq", 3))
+    if 'synthetic' in args.workloads:
+        workloads.append(make_workload('synthetic', synthetic_wordlist(args.synthetic_words),
+                                       get_fragments(args), args.cipher, args.mk))
+    if 'dict' in args.workloads:
+        if os.path.exists(args.dict):
+            workloads.append(make_workload('dict', load_wordlist(args.dict, args.min_word_length),
+                                           get_fragments(args), args.cipher, args.mk))
+        else:
+            print(f"skipping dict workload, {args.dict} not found")
+    if 'deep' in args.workloads:
+        for depth in args.depths:
+            workloads.append(make_workload(f"deep{depth}", DEEP_WORDLIST, ['c'] * depth, DEEP_CIPHER, 1))
+    return workloads
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--dict", default="/usr/share/dict/words")
+    parser.add_argument("-m", "--min-word-length", type=int, default=3)
+    parser.add_argument("--mk", type=int, default=5) # min_keylen
+    parser.add_argument("-c", "--cipher", default="xzfdqngqzpaps")
+    parser.add_argument("-l", "--lengths", type=str, default="6,8,10") # key_words cipher prefixes
+    parser.add_argument("--fl", "--find-length", dest="find_length", type=int, default=5) # find cipher prefix
+    parser.add_argument("--bl", "--brute-length", dest="brute_length", type=int, default=5)
+    parser.add_argument("-f", "--fragments", type=str)
+    parser.add_argument("--af", type=str) # add-fragments
+    parser.add_argument("-w", "--workloads", type=str, default="small,synthetic,dict")
+    parser.add_argument("-b", "--benchmarks", type=str, default=','.join(BENCHMARKS))
+    parser.add_argument("--sw", "--synthetic-words", dest="synthetic_words", type=int, default=100000)
+    parser.add_argument("--depths", type=str, default="8,24,64") # deep workload fragment counts
+    parser.add_argument("--limit", type=int, default=2000) # results per input
+    parser.add_argument("--nodes", type=int, default=100000) # find node limit
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--nm", action='store_true') # no peak memory pass
+    parser.add_argument("--save", type=str) # write results as a baseline JSON
+    parser.add_argument("--baseline", type=str) # compare against a baseline JSON
+    parser.add_argument("--tolerance", type=float, default=0.1) # allowed slowdown vs baseline
+    args = parser.parse_args()
+    args.lengths = [int(l) for l in args.lengths.split(',')]
+    args.depths = [int(d) for d in args.depths.split(',')]
+    args.workloads = args.workloads.split(',')
+    args.benchmarks = args.benchmarks.split(',')
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"'{name}' is not a benchmark. Benchmarks are: {','.join(BENCHMARKS)}")
+    return args
+
+def main():
+    args = parse_args()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = {}
+    regressions = []
+    mismatches = []
+    for wl in load_workloads(args):
+        print(f"{wl.name}: w: {len(wl.md.words.list)}, c: {wl.cipher}, f: {wl.fragments}")
+        if native is not None and native_mismatches(wl.md.words, wl.texts) != (0, 0):
+            mismatches.append(wl.name)
+        results[wl.name] = {}
+        for name in args.benchmarks:
+            result = run_bench(BENCHMARKS[name], wl, args)
+            base = baseline.get(wl.name, {}).get(name)
+            print_result(wl.name, name, result, base)
+            results[wl.name][name] = result._asdict()
+            if regressed(result, base, args.tolerance):
+                regressions.append(f"{wl.name}/{name}")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if mismatches:
+        print(f"native and Python results differ: {', '.join(mismatches)}")
+    if regressions:
+        print(f"slower than baseline: {', '.join(regressions)}")
+    if mismatches or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ import argparse
 import string
 import sys
 from collections import namedtuple
+from wordcache import load_compiled
+from codec import beaufort_decrypt, vigenere_decrypt, decode_texts
+from scoring import TopK, load_scorer
 Decrypted = namedtuple('Decrypted', ['vigenere', 'beaufort'])
 
 def clean_text(text):
@@ -10,60 +13,23 @@ def clean_text(text):
     text = text.translate(str.maketrans('', '', string.punctuation))
     return text
 
-def beaufort_decrypt(ciphertext, key):
-    """Decrypt Beaufort cipher with given key."""
-    plaintext = ""
-    key_length = len(key)
-    key_as_int = [ord(i) - ord('a') for i in key]
-    ciphertext_int = [ord(i) - ord('a') for i in ciphertext]
-    
-    for i in range(len(ciphertext_int)):
-        # Key difference: Beaufort uses (key - ciphertext) mod 26
-        # instead of Vigenère's (ciphertext - key) mod 26
-        plain = (key_as_int[i % key_length] - ciphertext_int[i]) % 26
-        plaintext += chr(plain + ord('a'))
-    
-    return plaintext
-
-def vigenere_decrypt(ciphertext, key):
-    """Decrypt Vigenère cipher with given key."""
-    plaintext = ""
-    key_length = len(key)
-    key_as_int = [ord(i) - ord('a') for i in key]
-    ciphertext_int = [ord(i) - ord('a') for i in ciphertext]
-    
-    for i in range(len(ciphertext_int)):
-        shift = key_as_int[i % key_length]
-        plain = (ciphertext_int[i] - shift) % 26
-        plaintext += chr(plain + ord('a'))
-    
-    return plaintext
-
 def decrypt(ciphertext, key):
-    vigenere = ""
-    beaufort = ""
-    key_length = len(key)
-    key_as_int = [ord(i) - ord('a') for i in key]
-    ciphertext_int = [ord(i) - ord('a') for i in ciphertext]
-    
-    for i in range(len(ciphertext_int)):
-        shift = key_as_int[i % key_length]
-        vig = (ciphertext_int[i] - shift) % 26
-        beau =  (shift - ciphertext_int[i]) % 26
-        vigenere += chr(vig + ord('a'))
-        beaufort += chr(beau + ord('a'))
-    
-    return Decrypted(vigenere=vigenere, beaufort=beaufort)
+    return Decrypted(vigenere=vigenere_decrypt(ciphertext, key),
+                     beaufort=beaufort_decrypt(ciphertext, key))
+
+def read_clean_words(filename, min_word_length=0):
+    word_set = set()
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            word = clean_text(line.strip())
+            if word:  # Only add non-empty words
+                word_set.add(word)
+    return sorted(word_set)
 
 def load_words_to_set(filename):
     # Load words from file into a set for O(1) lookup.
-    word_set = set()
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            for line in f:
-                word = clean_text(line.strip())
-                if word:  # Only add non-empty words
-                    word_set.add(word)
+        word_set = set(load_compiled(filename, "clean", 0, read_clean_words).words)
         #print(f"Loaded {len(word_set)} words into set")
         return word_set
     except FileNotFoundError:
@@ -94,29 +60,40 @@ def find_solutions(ciphertext, wordset, args, found_keys):
     solutions = {}
     clean_cipher = clean_text(ciphertext)
     
-    # Iterate through wordset for keys
+    # Collect the key for each word, then decode the cipher with every
+    # distinct key, batched where codec can
+    word_keys = []
     for word in wordset:
         if len(word) < args.length:
             continue
         if args.key_prefix is not None:
             word = args.key_prefix + word
-        key = word[:args.length]
-        #if key == "ti":
-        #    print(f"***{key}***")
-        #if key in found_keys:
-        #    continue
-        #found_keys.add(key_prefix)
-        decrypted = decrypt(clean_cipher, key)
+        word_keys.append((word, word[:args.length]))
+    keys = list(dict.fromkeys(key for _, key in word_keys if key))
+    if not keys:
+        return solutions
+    decoded = dict(zip(keys, decode_texts(clean_cipher, keys)))
+
+    for word, key in word_keys:
+        if not key: continue
+        beaufort = decoded[key]
         if (args.key_prefix, args.plain_prefix) == (None, None):
-            #if decrypted.vigenere[:args.length] in wordset:
-            #    add_solution(solutions, key, word, decrypted.vigenere[:len(word)])
-            if args.show_all or decrypted.beaufort[:args.length] in wordset:
-                add_solution(solutions, key, word, decrypted.beaufort[:len(word)])
+            if args.show_all or beaufort[:args.length] in wordset:
+                add_solution(solutions, key, word, beaufort[:len(word)])
         else:
+            decrypted = Decrypted(vigenere=None, beaufort=beaufort)
             add_any_prefix_solutions(solutions, decrypted, key, word, wordset, args)
-       
+
     return solutions
 
+def top_solutions(solutions, args):
+    # the args.top keys whose plaintext scores best, best first
+    scorer = load_scorer(args.corpus or args.dict, word_ranks=bool(args.corpus))
+    top = TopK(args.top)
+    for key, values in solutions.items():
+        top.push(scorer.score(values[0][1], key), key)
+    return {key: solutions[key] for _, key in top.results()}
+
 def show_solutions(solutions, args):
     if not solutions:
         print("No solutions found.")
@@ -150,6 +127,8 @@ def parse_args():
     parser.add_argument("-d", "--dict", default="/usr/share/dict/words")
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-a', '--show-all', action='store_true')
+    parser.add_argument("-t", "--top", type=int, help="show the top scored solutions")
+    parser.add_argument(      "--corpus", help="English text to score with, default --dict without word ranks")
     return parser.parse_args()
 
 def main():
@@ -175,6 +154,8 @@ def main():
         
     # Find solutions using set for both key source and word validation
     solutions = find_solutions(args.cipher, wordset, args, set())
+    if args.top:
+        solutions = top_solutions(solutions, args)
     show_solutions(solutions, args)
 
 if __name__ == "__main__":
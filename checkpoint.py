@@ -0,0 +1,44 @@
+import json
+import os
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+
+# Checkpoints of a find --cipher search. The search is run one first key
+# word at a time, in keyword list order, so its progress is the index of
+# the first key word being searched (next_word) plus, in one process, the
+# frame_cursor of the search of that word (cursor): resuming replays the
+# generators of the frames on the stack and goes on from there. Units
+# searched by --workers have no cursor; their progress is the number of
+# results already taken from the unit (emitted), and resuming searches the
+# unit again and skips those. search identifies the search the checkpoint
+# belongs to. key_words and plain_words are the --show-words WordTables, as
+# to_dict: as they are, with a cursor, or else as they were when the unit
+# at next_word started, so the words the resumed search sees again are not
+# counted twice.
+
+VERSION = 4
+
+@dataclass
+class Checkpoint:
+    search: dict
+    version: int = VERSION
+    next_word: int = 0
+    emitted: int = 0
+    last_plain: Optional[str] = None
+    output_offset: Optional[int] = None # size of the result file
+    cursor: Optional[dict] = None
+    key_words: dict = field(default_factory=dict)
+    plain_words: dict = field(default_factory=dict)
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(asdict(checkpoint), f)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('version') != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} checkpoint")
+    return Checkpoint(**data)
@@ -1,35 +1,71 @@
 from codec import decode_with_key, find_key
-from wordgen import Words, generate_words_with_prefix, contains_words_and_word_prefix
+from wordgen import make_words, generate_words_with_prefix, contains_words_and_word_prefix, advance_segments, is_feasible
 from util import aggregate_len, safe_len, load_wordlist, parse_args, join
 from typing import Optional
 
+# Fragment search states (segmentation state, remaining key, remaining
+# fragments) proven to produce no valid plaintext, shared across calls
+dead_states = set()
+dead_state_stats = {'hits': 0, 'misses': 0}
+MAX_DEAD_STATES = 1000000
+
+def print_dead_state_stats():
+    lookups = dead_state_stats['hits'] + dead_state_stats['misses']
+    hit_rate = 100 * dead_state_stats['hits'] / lookups if lookups else 0
+    print(f"dead states: {len(dead_states)}, hits: {dead_state_stats['hits']}, " \
+          f"misses: {dead_state_stats['misses']}, hit rate: {hit_rate:.1f}%")
+
+def remaining_fragments(fragments, used):
+    return [frag for idx, frag in enumerate(fragments) if not used & (1 << idx)]
+
 def generate_ciphers_for_key(ctx, md):
-    def backtrack(fragments, used_fragments):
-        if fragments:
-            cipher = ctx.cipher + join(ctx.fragments[i] for i in fragments)
-            plain = decode_with_key(cipher[:len(ctx.key)], ctx.key)
-            if ctx.plain_pfx:
-                plain = ctx.plain_pfx + plain
-            if not contains_words_and_word_prefix(plain, md.words):
-                if md.verbose: print(f"gen_cfk: Bad p: {plain}, k: {ctx.key}, c: {cipher}")
+    trie = md.words.trie
+    key = ctx.key
+
+    def get_plain(cipher):
+        return (ctx.plain_pfx or "") + decode_with_key(cipher[:len(key)], key)
+
+    # cipher is ctx.cipher plus the fragments in used (a bitmask of
+    # ctx.fragments indices); segments is the segmentation state of its
+    # plaintext
+    def backtrack(cipher, used, segments):
+        if used:
+            if not is_feasible(segments):
+                if md.verbose: print(f"gen_cfk: Bad p: {get_plain(cipher)}, k: {key}, c: {cipher}")
                 return
-            if md.verbose: print(f"gen_cfk: Good p: {plain}, k: {ctx.key}, c: {cipher}")
+            if md.verbose: print(f"gen_cfk: Good p: {get_plain(cipher)}, k: {key}, c: {cipher}")
 
-            if len(cipher) >= len(ctx.key):
-                if (md.verbose): print(f"{' ' * ctx.level} gen_cfk:{ctx.level} p: {plain}, k: {ctx.key}, c: {cipher}")
-                yield cipher, [frag for idx, frag in enumerate(ctx.fragments) if idx not in used_fragments]
+            if len(cipher) >= len(key):
+                if (md.verbose): print(f"{' ' * ctx.level} gen_cfk:{ctx.level} p: {get_plain(cipher)}, k: {key}, c: {cipher}")
+                yield cipher, remaining_fragments(ctx.fragments, used)
                 return
-        
-        for i in range(0, len(ctx.fragments)):
-            if i in used_fragments:
+
+        remaining = remaining_fragments(ctx.fragments, used)
+        state = (trie, frozenset(map(id, segments)), key[len(cipher):], tuple(sorted(remaining)))
+        if state in dead_states:
+            dead_state_stats['hits'] += 1
+            return
+        dead_state_stats['misses'] += 1
+
+        any_yielded = False
+        tried = set()
+        for i, frag in enumerate(ctx.fragments):
+            # fragments with the same content produce the same branch
+            if used & (1 << i) or frag in tried:
                 continue
-            used_fragments.add(i)
-            fragments.append(i)
-            yield from backtrack(fragments, used_fragments)
-            fragments.pop()
-            used_fragments.remove(i)
-    
-    yield from backtrack([], set())
+            tried.add(frag)
+            plain = decode_with_key(frag[:max(len(key) - len(cipher), 0)], key[len(cipher):])
+            for result in backtrack(cipher + frag, used | (1 << i), advance_segments(segments, plain, trie)):
+                any_yielded = True
+                yield result
+
+        if not any_yielded:
+            if len(dead_states) >= MAX_DEAD_STATES:
+                dead_states.clear()
+            dead_states.add(state)
+
+    segments = advance_segments([trie.root], get_plain(ctx.cipher), trie)
+    yield from backtrack(ctx.cipher, 0, segments)
 
 def generate_ciphers_for_plaintext(ctx, md, min_cipher_length: Optional[int] = None):
     #min_cipher_length = min_cipher_length or len(ctx.plaintext)
@@ -38,28 +74,24 @@ def generate_ciphers_for_plaintext(ctx, md, min_cipher_length: Optional[int] = N
     if len(ctx.cipher) >= min_cipher_length:
         yield ctx.cipher, ctx.fragments, False
 
-    def backtrack(fragments, used_fragments):
-        if fragments:
-            frags = join(ctx.fragments[i] for i in fragments)
-            cipher = ctx.cipher + frags
+    def backtrack(cipher, used):
+        if used:
             # TODO should probably change this logic/param to "one_fragments: True"
             # in which case... i don't think we need the gen.send(valid) feedback at all.
             if len(cipher) >= min_cipher_length:
                 #if (md.verbose): print(f"{' ' * ctx.level} gen_cfp:{ctx.level} p: {plain}, c: {cipher}")
-                remaining_fragments = [frag for idx, frag in enumerate(ctx.fragments) if idx not in used_fragments]
-                valid = yield cipher, remaining_fragments, False
+                valid = yield cipher, remaining_fragments(ctx.fragments, used), False
                 return
-        
-        for i in range(0, len(ctx.fragments)):
-            if i in used_fragments:
+
+        tried = set()
+        for i, frag in enumerate(ctx.fragments):
+            # fragments with the same content produce the same branch
+            if used & (1 << i) or frag in tried:
                 continue
-            used_fragments.add(i)
-            fragments.append(i)
-            yield from backtrack(fragments, used_fragments)
-            fragments.pop()
-            used_fragments.remove(i)
-    
-    yield from backtrack([], set())
+            tried.add(frag)
+            yield from backtrack(cipher + frag, used | (1 << i))
+
+    yield from backtrack(ctx.cipher, 0)
 
 
 """
@@ -158,7 +190,7 @@ def main():
     test_generate_ciphers2(fragments, wordlist) #, args.verbose)
 
     wordlist = load_wordlist(args.dict, args.min_word_length)
-    words = Words(set=set(wordlist), list=wordlist)
+    words = make_words(wordlist)
     test_generate_ciphers_for_key(fragments, words, args.verbose)
 
 
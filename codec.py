@@ -1,28 +1,115 @@
+import string
+from itertools import cycle
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import native # built from native.c
+except ImportError:
+    native = None
+
+LETTERS = string.ascii_lowercase
+ORD_A = ord('a')
 
 def find_key(cipher, plain):
-    #vig_key = ""
-    beau_key = ""
-    min_len = min(len(cipher), len(plain))
-    for i in range(min_len):
-        c = ord(cipher[i]) - ord('a')
-        p = ord(plain[i]) - ord('a')
-        #vig_key += chr((c - p) % 26 + ord('a'))
-        beau_key += chr((p + c) % 26 + ord('a'))
-    return beau_key
+    #vig_key = (c - p) % 26
+    return ''.join([LETTERS[(ord(c) + ord(p) - 2 * ORD_A) % 26] for c, p in zip(cipher, plain)])
 
 
 def beaufort_decrypt(cipher, key):
-    plain = ""
-    key_length = len(key)
-    key_as_int = [ord(i) - ord('a') for i in key]
-    cipher_as_int = [ord(i) - ord('a') for i in cipher]
-    for i in range(len(cipher_as_int)):
-        plain_as_int = (key_as_int[i % key_length] - cipher_as_int[i]) % 26
-        plain += chr(plain_as_int + ord('a'))
-    return plain
-    
+    return ''.join([LETTERS[(ord(k) - ord(c)) % 26] for c, k in zip(cipher, cycle(key))])
+
+
+def vigenere_decrypt(cipher, key):
+    return ''.join([LETTERS[(ord(c) - ord(k)) % 26] for c, k in zip(cipher, cycle(key))])
+
 
 def decode_with_key(cipher, key):
     return beaufort_decrypt(cipher, key)
 
+if native is not None:
+    decode_with_key = native.decode
+
+
+# Batch operations. Ciphers, keys and plaintexts are uint8 arrays of letter
+# values 0-25; a batch of N strings is an N x length 2-D array. Only a-z
+# text fits: anything else wraps around in the uint8 arithmetic, so check
+# with is_letters first.
+
+def is_letters(text):
+    return text.isascii() and text.isalpha() and text.islower()
+
+def require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for batch codec operations")
+
+def to_array(text):
+    require_numpy()
+    return np.frombuffer(text.encode('ascii'), dtype=np.uint8) - ORD_A
+
+
+def to_matrix(texts, width):
+    # texts are truncated, or padded with 'a', to width
+    require_numpy()
+    data = ''.join([text[:width].ljust(width, 'a') for text in texts])
+    return (np.frombuffer(data.encode('ascii'), dtype=np.uint8) - ORD_A).reshape(len(texts), width)
+
+
+def to_texts(matrix):
+    require_numpy()
+    rows = (matrix + ORD_A).astype(np.uint8)
+    width = rows.shape[1]
+    if width == 0:
+        return [''] * rows.shape[0]
+    data = rows.tobytes().decode('ascii')
+    return [data[i:i + width] for i in range(0, len(data), width)]
+
+
+def key_matrix(keys, length):
+    # each key repeated to length, as beaufort_decrypt does
+    require_numpy()
+    if not keys:
+        return np.zeros((0, length), dtype=np.uint8)
+    key_lens = np.array([len(key) for key in keys], dtype=np.intp)
+    if not key_lens.all():
+        raise ValueError("keys must not be empty")
+    padded = to_matrix(keys, key_lens.max())
+    indices = np.arange(length) % key_lens[:, None]
+    return np.take_along_axis(padded, indices, axis=1)
+
+
+def decode_batch(cipher, keys):
+    # decode one cipher with each of N keys; returns an N x len(cipher) array
+    c = to_array(cipher)
+    k = key_matrix(keys, len(cipher))
+    return (k + 26 - c) % 26
+
+
+def decode_texts(cipher, keys):
+    # beaufort_decrypt of cipher with each key, decoding the a-z keys in
+    # one batch; other keys, or all of them without numpy, decode one by one
+    if np is None or not is_letters(cipher):
+        return [beaufort_decrypt(cipher, key) for key in keys]
+    batch = [key for key in keys if is_letters(key)]
+    decoded = dict(zip(batch, to_texts(decode_batch(cipher, batch)))) if batch else {}
+    return [decoded[key] if key in decoded else beaufort_decrypt(cipher, key) for key in keys]
+
+
+def decode_keys(cipher, matrix):
+    # decode cipher with each row of an N x width key matrix, without
+    # repeating keys; returns an N x min(len(cipher), width) array
+    width = min(len(cipher), matrix.shape[1])
+    return (matrix[:, :width] + 26 - to_array(cipher[:width])) % 26
+
 
+def find_keys(cipher, plains):
+    # derive the key for each of N plaintexts; returns an N x length array
+    # where length = min(len(cipher), longest plaintext). rows are only
+    # meaningful up to the length of their plaintext.
+    length = min(len(cipher), max((len(plain) for plain in plains), default=0))
+    c = to_array(cipher[:length])
+    p = to_matrix(plains, length)
+    return (p + c) % 26
@@ -1,24 +1,70 @@
+import copy
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import NamedTuple, Optional, List
 
 @dataclass
 class Pkc:
     plaintext: str = ""
     key: str = ""
     cipher: str = ""
-
-@dataclass
-class Context(Pkc):
+    # word splits of plaintext and key, and the level and remaining
+    # fragments of a result
+    plain_words: Optional[List[str]] = None
+    key_words: Optional[List[str]] = None
     level: int = 0
+    fragments: Optional[List[str]] = None
+
+class Span:
+    # One step of the plaintext, key and cipher of a result, after the
+    # steps of parent: the first length letters of cipher, split into
+    # plain_words, keyed by the first length letters of key_words. cipher
+    # and key_words are shared with the Context the step was taken from.
+    # pkc caches the steps up to this one once a result needs them.
+    __slots__ = ('parent', 'plain_words', 'key_words', 'cipher', 'length', 'pkc')
+
+    def __init__(self, parent, plain_words, key_words, cipher, length):
+        self.parent = parent
+        self.plain_words = plain_words
+        self.key_words = key_words
+        self.cipher = cipher
+        self.length = length
+        self.pkc = None
+
+def span_pkc(span):
+    # The steps up to span as a new Pkc, materializing the steps that are
+    # not cached yet
+    spans = []
+    while span and span.pkc is None:
+        spans.append(span)
+        span = span.parent
+    pkc = span.pkc if span else Pkc()
+    for span in reversed(spans):
+        key_words, _ = split_key_words(span.key_words, span.length)
+        pkc = Pkc(
+            plaintext = pkc.plaintext + ''.join(span.plain_words),
+            key = pkc.key + ''.join(span.key_words)[:span.length],
+            cipher = pkc.cipher + span.cipher[:span.length],
+            plain_words = (pkc.plain_words or []) + span.plain_words,
+            key_words = extend_key_words(pkc.key_words, key_words, cuts_key_word(span.parent))
+        )
+        span.pkc = pkc
+    return copy.copy(pkc)
+
+# Contexts are immutable: a search step makes a new Context with _replace.
+# level is the level of the op the Context is expanded by.
+class Context(NamedTuple):
+    level: int = 1
     once: bool = False
     fragments: List[str] = None
+    cipher: str = ""
+    key: str = ""
     plaintext: Optional[str] = None
     plain_words: Optional[List[str]] = None
     plain_pfx: Optional[str] = None
     key_words: Optional[List[str]] = None
     key_pfx: Optional[str] = None
-    key_sfx: Optional[str] = None
-    pkc: Pkc = field(default_factory=Pkc)
+    first_key_words: Optional[List[str]] = None # restricts the first key word
+    span: Optional[Span] = None # the steps taken to reach this context
 
     def __str__(self):
         str = ""
@@ -33,3 +79,34 @@ class Context(Pkc):
     def print(self, hdr=None):
         if hdr: print(hdr)
         print(self)
+
+def split_key_words(key_words, length):
+    # Split key_words at length into the words covering length, the last of
+    # which may be cut, and the remaining words, the first of which
+    # continues the cut word if one was cut.
+    pos = 0
+    for i, word in enumerate(key_words):
+        if pos + len(word) >= length:
+            cut = length - pos
+            if cut == len(word):
+                return key_words[:i + 1], key_words[i + 1:]
+            return key_words[:i] + [word[:cut]], [word[cut:]] + key_words[i + 1:]
+        pos += len(word)
+    return list(key_words), []
+
+def cuts_key_word(span):
+    # True if span ends inside one of its key words, so the first key word
+    # after it continues that word
+    pos = 0
+    for word in span.key_words if span else ():
+        pos += len(word)
+        if pos >= span.length:
+            return pos > span.length
+    return False
+
+def extend_key_words(key_words, more_key_words, continues=True):
+    # if continues, the first of more_key_words continues the last of
+    # key_words
+    if not continues or not key_words or not more_key_words:
+        return (key_words or []) + (more_key_words or [])
+    return key_words[:-1] + [key_words[-1] + more_key_words[0]] + more_key_words[1:]
@@ -2,24 +2,13 @@ import argparse
 import string
 import sys
 from collections import namedtuple
+from codec import beaufort_decrypt, vigenere_decrypt
 
 Decrypted = namedtuple('Decrypted', ['vigenere', 'beaufort'])
 
 def decrypt(ciphertext, key):
-    vigenere = ""
-    beaufort = ""
-    key_length = len(key)
-    key_as_int = [ord(i) - ord('a') for i in key]
-    ciphertext_int = [ord(i) - ord('a') for i in ciphertext]
-    
-    for i in range(len(ciphertext_int)):
-        shift = key_as_int[i % key_length]
-        vig = (ciphertext_int[i] - shift) % 26
-        beau =  (shift - ciphertext_int[i]) % 26
-        vigenere += chr(vig + ord('a'))
-        beaufort += chr(beau + ord('a'))
-    
-    return Decrypted(vigenere=vigenere, beaufort=beaufort)
+    return Decrypted(vigenere=vigenere_decrypt(ciphertext, key),
+                     beaufort=beaufort_decrypt(ciphertext, key))
 
 def find_key(ciphertext, plaintext):
     vig_key = ""
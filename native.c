@@ -0,0 +1,323 @@
+/*
+ * Compiled inner loops of the search, as the optional Python module native:
+ *
+ *   decode(cipher, key)  Beaufort decode of cipher with key repeated, as
+ *                        codec.beaufort_decrypt
+ *   Trie(words)          a trie of sorted words; feasible(text) is
+ *                        wordgen.is_feasible_text of it
+ *
+ * Build it next to the Python modules with:
+ *
+ *   cc -O2 -shared -fPIC $(python3-config --includes) \
+ *       -o native$(python3-config --extension-suffix) native.c
+ *
+ * codec and wordgen use it when it imports, and the Python code otherwise.
+ *
+ * The trie is two arrays indexed by node, the root first: the mask of a
+ * node has bit c set for a child letter c and bit END_BIT if it ends a
+ * word, and its children are stored consecutively, in letter order, from
+ * first[node]. The child of letter c is first[node] plus the number of
+ * child letters before c.
+ *
+ * A word is stored only up to its first letter outside a-z, such as an
+ * accented letter. Decoded text is always a-z, so the rest of the word can
+ * never match; the node it stops at gets MORE_BIT instead, so that it is
+ * still a word prefix, as it is in the Python trie.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <stdlib.h>
+
+#define LETTER_BITS 0x3ffffffu
+#define END_BIT (1u << 26)
+#define MORE_BIT (1u << 27)
+
+static const char LETTERS[] = "abcdefghijklmnopqrstuvwxyz";
+
+static PyObject *
+native_decode(PyObject *self, PyObject *args)
+{
+    PyObject *cipher, *key;
+    if (!PyArg_ParseTuple(args, "UU:decode", &cipher, &key))
+        return NULL;
+    Py_ssize_t cipher_len = PyUnicode_GET_LENGTH(cipher);
+    Py_ssize_t key_len = PyUnicode_GET_LENGTH(key);
+    Py_ssize_t len = key_len ? cipher_len : 0;
+    PyObject *plain = PyUnicode_New(len, 127);
+    if (plain == NULL)
+        return NULL;
+    int cipher_kind = PyUnicode_KIND(cipher), key_kind = PyUnicode_KIND(key);
+    const void *cipher_data = PyUnicode_DATA(cipher), *key_data = PyUnicode_DATA(key);
+    Py_UCS1 *out = PyUnicode_1BYTE_DATA(plain);
+    for (Py_ssize_t i = 0, k = 0; i < len; ++i) {
+        long d = ((long)PyUnicode_READ(key_kind, key_data, k) -
+                  (long)PyUnicode_READ(cipher_kind, cipher_data, i)) % 26;
+        out[i] = LETTERS[d < 0 ? d + 26 : d];
+        if (++k == key_len)
+            k = 0;
+    }
+    return plain;
+}
+
+typedef struct {
+    PyObject_HEAD
+    uint32_t *mask;
+    uint32_t *first;
+    Py_ssize_t size;
+} TrieObject;
+
+/* the trie while it is built, each node's children as a list in letter
+ * order; words are added in sorted order, so a word's next letter is
+ * either its node's last child or a new child after it */
+typedef struct {
+    uint32_t *first_child, *last_child, *next_sibling, *mask;
+    uint8_t *letter;
+    Py_ssize_t size, capacity;
+} Builder;
+
+static int
+builder_grow(Builder *b)
+{
+    Py_ssize_t capacity = b->capacity ? 2 * b->capacity : 1024;
+    uint32_t **arrays[] = {&b->first_child, &b->last_child, &b->next_sibling, &b->mask};
+    for (size_t i = 0; i < sizeof(arrays) / sizeof(*arrays); ++i) {
+        uint32_t *grown = realloc(*arrays[i], capacity * sizeof(uint32_t));
+        if (grown == NULL)
+            return -1;
+        *arrays[i] = grown;
+    }
+    uint8_t *letter = realloc(b->letter, capacity);
+    if (letter == NULL)
+        return -1;
+    b->letter = letter;
+    b->capacity = capacity;
+    return 0;
+}
+
+static void
+builder_free(Builder *b)
+{
+    free(b->first_child);
+    free(b->last_child);
+    free(b->next_sibling);
+    free(b->mask);
+    free(b->letter);
+}
+
+/* 0 if word was added, 1 if it is not in sorted order, -1 if out of
+ * memory; a word is added up to its first letter outside a-z */
+static int
+builder_add(Builder *b, PyObject *word)
+{
+    int kind = PyUnicode_KIND(word);
+    const void *data = PyUnicode_DATA(word);
+    uint32_t node = 0;
+    for (Py_ssize_t i = 0; i < PyUnicode_GET_LENGTH(word); ++i) {
+        Py_UCS4 ch = PyUnicode_READ(kind, data, i);
+        if (ch < 'a' || ch > 'z') {
+            b->mask[node] |= MORE_BIT;
+            return 0;
+        }
+        uint8_t c = (uint8_t)(ch - 'a');
+        uint32_t last = b->last_child[node];
+        if (last && b->letter[last] == c) {
+            node = last;
+            continue;
+        }
+        if (last && b->letter[last] > c)
+            return 1; /* not sorted */
+        if (b->size == b->capacity && builder_grow(b) < 0)
+            return -1;
+        uint32_t child = (uint32_t)b->size++;
+        b->first_child[child] = b->last_child[child] = b->next_sibling[child] = 0;
+        b->mask[child] = 0;
+        b->letter[child] = c;
+        if (last)
+            b->next_sibling[last] = child;
+        else
+            b->first_child[node] = child;
+        b->last_child[node] = child;
+        b->mask[node] |= 1u << c;
+        node = child;
+    }
+    b->mask[node] |= END_BIT;
+    return 0;
+}
+
+static int
+Trie_init(TrieObject *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *words;
+    if (!PyArg_ParseTuple(args, "O:Trie", &words))
+        return -1;
+    PyObject *seq = PySequence_Fast(words, "words must be a sequence");
+    if (seq == NULL)
+        return -1;
+    Builder b = {0};
+    int status = builder_grow(&b);
+    if (status == 0) {
+        b.size = 1;
+        b.first_child[0] = b.last_child[0] = b.next_sibling[0] = b.mask[0] = 0;
+    }
+    for (Py_ssize_t i = 0; status == 0 && i < PySequence_Fast_GET_SIZE(seq); ++i) {
+        PyObject *word = PySequence_Fast_GET_ITEM(seq, i);
+        if (!PyUnicode_Check(word)) {
+            status = 1;
+            break;
+        }
+        status = builder_add(&b, word);
+    }
+    Py_DECREF(seq);
+    if (status) {
+        builder_free(&b);
+        if (status < 0)
+            PyErr_NoMemory();
+        else
+            PyErr_SetString(PyExc_ValueError, "words must be sorted strings");
+        return -1;
+    }
+    /* lay the nodes out breadth first, so each node's children are
+     * consecutive; order[i] is the builder node of trie node i */
+    uint32_t *order = malloc(b.size * sizeof(uint32_t));
+    uint32_t *mask = malloc(b.size * sizeof(uint32_t));
+    uint32_t *first = malloc(b.size * sizeof(uint32_t));
+    if (order == NULL || mask == NULL || first == NULL) {
+        free(order);
+        free(mask);
+        free(first);
+        builder_free(&b);
+        PyErr_NoMemory();
+        return -1;
+    }
+    Py_ssize_t size = 1;
+    order[0] = 0;
+    for (Py_ssize_t i = 0; i < b.size; ++i) {
+        uint32_t node = order[i];
+        mask[i] = b.mask[node];
+        first[i] = (uint32_t)size;
+        for (uint32_t child = b.first_child[node]; child; child = b.next_sibling[child])
+            order[size++] = child;
+    }
+    free(order);
+    builder_free(&b);
+    free(self->mask);
+    free(self->first);
+    self->mask = mask;
+    self->first = first;
+    self->size = size;
+    return 0;
+}
+
+static void
+Trie_dealloc(TrieObject *self)
+{
+    free(self->mask);
+    free(self->first);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *
+Trie_feasible(TrieObject *self, PyObject *text)
+{
+    if (!PyUnicode_Check(text)) {
+        PyErr_SetString(PyExc_TypeError, "text must be a str");
+        return NULL;
+    }
+    Py_ssize_t len = PyUnicode_GET_LENGTH(text);
+    if (len == 0)
+        Py_RETURN_TRUE;
+    if (self->mask == NULL) {
+        PyErr_SetString(PyExc_ValueError, "Trie is not initialized");
+        return NULL;
+    }
+    /* the open word nodes, as in wordgen.advance_segments: each node has at
+     * most one child per letter, and the root is added once, so there are
+     * at most len + 1 of them */
+    uint32_t small[2 * 64];
+    uint32_t *segments = len < 64 ? small : malloc(2 * (len + 1) * sizeof(uint32_t));
+    if (segments == NULL)
+        return PyErr_NoMemory();
+    uint32_t *next = segments + (len < 64 ? 64 : len + 1);
+    int kind = PyUnicode_KIND(text);
+    const void *data = PyUnicode_DATA(text);
+    Py_ssize_t count = 1;
+    segments[0] = 0;
+    for (Py_ssize_t i = 0; i < len && count; ++i) {
+        Py_UCS4 ch = PyUnicode_READ(kind, data, i);
+        if (ch < 'a' || ch > 'z') {
+            count = 0;
+            break;
+        }
+        unsigned c = ch - 'a';
+        Py_ssize_t next_count = 0;
+        int boundary = 0;
+        for (Py_ssize_t j = 0; j < count; ++j) {
+            uint32_t mask = self->mask[segments[j]];
+            if (!(mask >> c & 1))
+                continue;
+            uint32_t child = self->first[segments[j]] +
+                (uint32_t)__builtin_popcount(mask & ((1u << c) - 1));
+            next[next_count++] = child;
+            if (self->mask[child] & END_BIT)
+                boundary = 1;
+        }
+        if (boundary)
+            next[next_count++] = 0;
+        uint32_t *swap = segments;
+        segments = next;
+        next = swap;
+        count = next_count;
+    }
+    int feasible = 0;
+    for (Py_ssize_t j = 0; j < count && !feasible; ++j)
+        feasible = (self->mask[segments[j]] & (LETTER_BITS | MORE_BIT)) != 0;
+    if (segments != small && next != small)
+        free(segments < next ? segments : next);
+    return PyBool_FromLong(feasible);
+}
+
+static PyMethodDef Trie_methods[] = {
+    {"feasible", (PyCFunction)Trie_feasible, METH_O,
+     "True if text is words followed by a (possibly empty) word prefix."},
+    {NULL}
+};
+
+static PyTypeObject TrieType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "native.Trie",
+    .tp_doc = "Trie of a sorted list of words.",
+    .tp_basicsize = sizeof(TrieObject),
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc)Trie_init,
+    .tp_dealloc = (destructor)Trie_dealloc,
+    .tp_methods = Trie_methods,
+};
+
+static PyMethodDef native_methods[] = {
+    {"decode", native_decode, METH_VARARGS,
+     "Beaufort decode of cipher with key repeated."},
+    {NULL}
+};
+
+static struct PyModuleDef native_module = {
+    PyModuleDef_HEAD_INIT, "native", NULL, -1, native_methods,
+};
+
+PyMODINIT_FUNC
+PyInit_native(void)
+{
+    if (PyType_Ready(&TrieType) < 0)
+        return NULL;
+    PyObject *module = PyModule_Create(&native_module);
+    if (module == NULL)
+        return NULL;
+    Py_INCREF(&TrieType);
+    if (PyModule_AddObject(module, "Trie", (PyObject *)&TrieType) < 0) {
+        Py_DECREF(&TrieType);
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
+}
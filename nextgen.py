@@ -1,17 +1,34 @@
-import copy
+import heapq
+import io
+import os
+import signal
+import sys
+import time
+import ciphergen
+import wordgen
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from codec import decode_with_key, find_key
 from wordgen import *
-from ciphergen import generate_ciphers_for_key, generate_ciphers_for_plaintext
+from ciphergen import generate_ciphers_for_key, generate_ciphers_for_plaintext, print_dead_state_stats
 from util import aggregate_len, safe_len, load_wordlist, parse_args, join
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from enum import Enum
 from typing import NamedTuple
-from context import Pkc, Context
+from context import Pkc, Context, Span, span_pkc, split_key_words, cuts_key_word, extend_key_words
+from results import ResultWriter
+from checkpoint import Checkpoint, save_checkpoint, load_checkpoint
+from stats import search_stats
+from wordtable import WordTable
+from scoring import Scorer, TopK, load_scorer
+from product import product_search
 
 Metadata = namedtuple('Metadata', ['words', 'keywords', 'verbose', 'min_keylen'])
 
-all_key_words = {}
-all_plain_words = {}
+# WordTables of the key and plaintext words seen, when collected for
+# --show-words
+all_key_words = None
+all_plain_words = None
 
 class Op(Enum):
     CIPHERS_FOR_KEY = 1,
@@ -20,43 +37,54 @@ class Op(Enum):
     PLAINTEXT_FOR_PREFIX = 4,
     CIPHERS_FOR_PLAINTEXT = 5
 
+# the generator each op expands its children from
+OP_GENERATORS = {
+    Op.CIPHERS_FOR_KEY.name: "generate_ciphers_for_key",
+    Op.KEY_WORDS.name: "keyword_generator",
+    Op.PLAINTEXT_WORDS.name: "generate_words",
+    Op.PLAINTEXT_FOR_PREFIX.name: "generate_words_with_prefix",
+    Op.CIPHERS_FOR_PLAINTEXT.name: "generate_ciphers_for_plaintext"
+}
+
+def collect_words(capacity=None):
+    global all_key_words, all_plain_words
+    all_key_words = WordTable(capacity)
+    all_plain_words = WordTable(capacity)
+
 def add_key_words(ctx):
+    # only whole key words: a first key word that continues one cut by the
+    # last span is skipped
+    if all_key_words is None: return
+    key_words = ctx.key_words
     pos = 0
-    for idx, key in enumerate(ctx.key_words):
-        cipher = ctx.cipher[pos:pos + len(key)]
-        if key not in all_key_words:
-            all_key_words[key] = {}
-        all_key_words[key][cipher] = decode_with_key(cipher, key)
+    if key_words and cuts_key_word(ctx.span):
+        pos = len(key_words[0])
+        key_words = key_words[1:]
+    for key in key_words:
+        all_key_words.add(key, ctx.cipher[pos:pos + len(key)])
         pos += len(key)
 
 def add_plain_words(ctx, plain_words, plain_pfx):
+    if all_plain_words is None: return
     if plain_words:
         word = join(plain_words)
     else:
         word = plain_pfx
-    if word not in all_plain_words:
-        all_plain_words[word] = set()
-    all_plain_words[word].add(plain_pfx)
+    all_plain_words.add(word, plain_pfx)
 
 def show_all_words():
+    # the decoded plaintexts are not stored, only the ciphers
     print("\nkey\n-----")
-    keys = list(all_key_words.keys())
-    keys.sort()
-    #for word, ciphers in all_key_words.items(): print(f"{word}{' ' * (10 - len(word))}: {ciphers}")
-    for key in keys: print(f"{key}{' ' * (10 - len(key))}: {all_key_words[key]}")
+    for key, ciphers in all_key_words.words():
+        print(f"{key}{' ' * (10 - len(key))}: {({cipher: decode_with_key(cipher, key) for cipher in ciphers})}")
 
     print("\nplain\n-----")
-    words = list(all_plain_words.keys())
-    words.sort()
-    for word in words: print(f"{word}{' ' * (10 - len(word))}: {all_plain_words[word]}")
+    for word, pfxs in all_plain_words.words():
+        print(f"{word}{' ' * (10 - len(word))}: {set(pfxs)}")
 
 def plain_word_ctx(plain_word, ctx, md, once=False):
-    copy.copy(ctx)
-    ctx.plaintext = plain_word
-    ctx.plain_words = [plain_word]
-    ctx.plain_pfx = None
-    ctx.once = once
-    return ctx
+    return ctx._replace(level=ctx.level + 1, plaintext=plain_word, plain_words=[plain_word],
+                        plain_pfx=None, once=once)
 
 def add_key_prefix(ctx, md):
     key_len = aggregate_len(ctx.key_words)
@@ -77,14 +105,11 @@ def add_key_prefix(ctx, md):
     # otherwise this assert would matter (presumably)
     # see above: no ctx.once test if [key_words] exists.
     #ctx.key_pfx = key[min(key_len, len(ctx.plaintext)):]
-    ctx.key_pfx = key[key_len:]
     #if md.verbose: print(f"kp: {ctx.key_pfx}")
-    return ctx
+    return ctx._replace(key_pfx=key[key_len:])
 
 def key_ctx_for_cipher(cipher, fragments, ctx, md):
-    ctx = copy.copy(ctx)
-    ctx.cipher = cipher
-    ctx.fragments = fragments
+    ctx = ctx._replace(level=ctx.level + 1, cipher=cipher, fragments=fragments)
     return add_key_prefix(ctx, md)
 
 """
@@ -110,89 +135,73 @@ def next_key_common(ctx, md):
     yield from generate_next(Op.KEY_WORDS, ctx, md)
 """
 
-def next_plaintext_for_prefix(plain_words, plain_pfx, ctx, md):
+def prefix_ctx_for_words(plain_words, plain_pfx, ctx, md):
     assert plain_pfx
-    pkc = copy.copy(ctx.pkc)
+    span = ctx.span
     key_words = ctx.key_words
     cipher = ctx.cipher
     if plain_words:
-        plaintext = join(plain_words)
-        pkc.plaintext += plaintext
-        key = join(ctx.key_words)
-
-        if md.verbose: print(f"{' ' * ctx.level} next_pfp k: {key}, p: {plaintext}, pp: {plain_pfx}, c: {cipher}")
-
-        pkc.key += key[:len(plaintext)]
-        key_words = [key[len(plaintext):]]
-        pkc.cipher += ctx.cipher[:len(plaintext)]
-        cipher = cipher[len(plaintext):]
+        length = aggregate_len(plain_words)
+        if md.verbose: print(f"{' ' * ctx.level} next_pfp k: {join(ctx.key_words)}, p: {join(plain_words)}, " \
+                             f"pp: {plain_pfx}, c: {cipher}")
+        span = Span(span, plain_words, ctx.key_words, ctx.cipher, length)
+        _, key_words = split_key_words(ctx.key_words, length)
+        cipher = cipher[length:]
 
-    ctx = Context(
-        level = ctx.level,
+    return Context(
+        level = ctx.level + 1,
         once = ctx.once,
         fragments = ctx.fragments,
         plain_pfx = plain_pfx,
         key_words = key_words,
         cipher = cipher,
-        pkc = pkc
+        span = span
     )
-    value = yield from generate_next(Op.PLAINTEXT_FOR_PREFIX, ctx, md)
-    return value
 
-def next_plaintext_for_cipher(cipher, fragments, ctx, md):
+def plain_ctx_for_cipher(cipher, fragments, ctx, md):
     assert cipher
     key = join(ctx.key_words)
     plaintext = decode_with_key(cipher[:len(key)], key)
-    ctx = Context(
-        level = ctx.level,
+    return Context(
+        level = ctx.level + 1,
         once = ctx.once,
         key_words = ctx.key_words,
         plain_pfx = ctx.plain_pfx,
-        pkc = ctx.pkc,
+        span = ctx.span,
         cipher = cipher,
         fragments = fragments,
         plaintext = plaintext
     )
-    value = yield from generate_next(Op.PLAINTEXT_WORDS, ctx, md)
-    return value
 
-def next_plaintext_for_key(key_words, ctx, md):
+def plain_ctx_for_key(key_words, ctx, md):
     assert key_words
     key = join(key_words)
     plaintext = decode_with_key(ctx.cipher[:len(key)], key)
-    ctx = Context(
-        level = ctx.level,
+    return Context(
+        level = ctx.level + 1,
         once = ctx.once,
         fragments = ctx.fragments,
         cipher = ctx.cipher,
         plain_pfx = ctx.plain_pfx,
-        pkc = ctx.pkc,
+        span = ctx.span,
         key_words = key_words,
         key = key,
         plaintext = plaintext
     )
-    value = yield from generate_next(Op.PLAINTEXT_WORDS, ctx, md)
-    return value
-
-def next_ciphers_for_key(key_words, ctx, md):
-    if not ctx.fragments:
-        #yield ctx.pkc, "cfk"
-        return False
 
+def cipher_ctx_for_key(key_words, ctx, md):
     assert key_words
     key = join(key_words)
-    ctx = Context(
-        level = ctx.level,
+    return Context(
+        level = ctx.level + 1,
         once = ctx.once,
         fragments = ctx.fragments,
         cipher = ctx.cipher,
         plain_pfx = ctx.plain_pfx,
-        pkc = ctx.pkc,
+        span = ctx.span,
         key_words = key_words,
         key = key
     )
-    value = yield from generate_next(Op.CIPHERS_FOR_KEY, ctx, md)
-    return value
 
 """
 def next_ciphers_for_plain_word(plain_word, ctx, md):
@@ -215,115 +224,402 @@ def final_context(plain_words, key_words, ctx, md):
         hdr += "PERFECT "
     else:
         hdr += "FINAL "
-    pkc = copy.copy(ctx.pkc)
+    pkc = span_pkc(ctx.span)
+    pkc.level = ctx.level
+    pkc.fragments = ctx.fragments
     if ctx.plain_words:
         pkc.plaintext += join(ctx.plain_words)
+        pkc.plain_words = (pkc.plain_words or []) + ctx.plain_words
     if plain_words:
         pkc.plaintext += join(plain_words)
+        pkc.plain_words = (pkc.plain_words or []) + plain_words
         hdr += "pln_words"
     if ctx.key_words:
         pkc.key += join(ctx.key_words)
+        pkc.key_words = extend_key_words(pkc.key_words, ctx.key_words, cuts_key_word(ctx.span))
     if key_words:
         pkc.key += join(key_words)
+        pkc.key_words = extend_key_words(pkc.key_words, key_words, bool(ctx.key_words))
         hdr += "key_words"
     if ctx.cipher:
         pkc.cipher += ctx.cipher
     return pkc, hdr
 
+# Transposition table of search states with no results below them. The
+# key is the part of the Context that determines what generate_next
+# explores, with the dictionaries and min_keylen it was searched with; the
+# value is what generate_next returned for it. The tries of the
+# dictionaries are in the key themselves, not their ids, which a later
+# dictionary could reuse once a trie is freed.
+dead_contexts = OrderedDict()
+dead_context_stats = {'hits': 0, 'misses': 0}
+MAX_DEAD_CONTEXTS = 1 << 18
+
+def context_residue(op, ctx, md):
+    return (md.words.trie, md.keywords.trie, md.min_keylen,
+            op, ctx.once, ctx.cipher, tuple(sorted(ctx.fragments or ())), ctx.plaintext,
+            join(ctx.plain_words or ()), ctx.plain_pfx, tuple(ctx.key_words or ()), ctx.key_pfx,
+            ctx.key, ctx.first_key_words and tuple(ctx.first_key_words))
+
+def print_dead_context_stats():
+    lookups = dead_context_stats['hits'] + dead_context_stats['misses']
+    hit_rate = 100 * dead_context_stats['hits'] / lookups if lookups else 0
+    print(f"dead contexts: {len(dead_contexts)}, hits: {dead_context_stats['hits']}, " \
+          f"misses: {dead_context_stats['misses']}, hit rate: {hit_rate:.1f}%")
+
+def clear_memos():
+    # the memo tables of the search are module globals: clear them to start
+    # a search afresh in the same process
+    dead_contexts.clear()
+    ciphergen.dead_states.clear()
+    wordgen.key_candidates.clear()
+    wordgen.decoded_ranges.clear()
+    wordgen.letter_matrices.clear()
+    wordgen.native_tries.clear()
+    wordgen.is_feasible_text.cache_clear()
+
 def generate_next(op, ctx, md):
-    ctx.level += 1
-    any_valid = False
+    residue = context_residue(op, ctx, md)
+    if residue in dead_contexts:
+        dead_context_stats['hits'] += 1
+        dead_contexts.move_to_end(residue)
+        return dead_contexts[residue]
+    dead_context_stats['misses'] += 1
+
+    any_yielded = False
+    op_generator = generate_op(op, ctx, md)
+    try:
+        result = next(op_generator)
+        while True:
+            any_yielded = True
+            result = op_generator.send((yield result))
+    except StopIteration as stop:
+        any_valid = stop.value
+
+    if not any_yielded:
+        dead_contexts[residue] = any_valid
+        if len(dead_contexts) > MAX_DEAD_CONTEXTS:
+            dead_contexts.popitem(last=False)
+    return any_valid
+
+def generate_op(op, ctx, md):
+    # The children of op, from open_frame and expand_item as iterate_next
+    # has them, each child op expanded by recursing into generate_next
+    frame = open_frame(op, ctx, md)
+    feedback = op in FEEDBACK_OPS
+    try:
+        item = next(frame.items)
+        while True:
+            child = expand_item(frame, item, md)
+            if type(child) is bool:
+                valid = child
+            elif type(child[0]) is Op:
+                valid = yield from generate_next(child[0], child[1], md)
+            else:
+                yield child
+                valid = True
+            if feedback:
+                if valid: frame.any_valid = True
+                if frame.once if op is Op.PLAINTEXT_FOR_PREFIX else ctx.once:
+                    break
+            item = frame.items.send(valid if feedback else None)
+    except StopIteration:
+        pass
+    return frame.any_valid
+
+# Iterative search. iterate_next explores the same ops in the same order as
+# generate_next, but keeps the ops being expanded on an explicit stack of
+# Frames instead of nested generators: a result is yielded straight to the
+# caller rather than through every level above it, and the search depth is
+# not limited by the recursion limit. A frame is dead, as in generate_next,
+# if no result was yielded since it was pushed. Both engines, and
+# best_first_next, take the children of an op from open_frame and
+# expand_item, so they can't differ in what an op expands to.
+
+class Frame:
+    __slots__ = ('op', 'ctx', 'residue', 'items', 'value', 'sent', 'once', 'any_valid', 'results')
+
+# ops whose generator is sent whether each child was valid
+FEEDBACK_OPS = (Op.KEY_WORDS, Op.PLAINTEXT_FOR_PREFIX, Op.CIPHERS_FOR_PLAINTEXT)
+
+def open_frame(op, ctx, md):
+    # Enter op and start the generator of its children.
+    frame = Frame()
+    frame.op = op
+    frame.ctx = ctx
+    frame.value = None
+    frame.sent = [] # the values sent to items, one per item taken
+    frame.once = None
+    frame.any_valid = op not in FEEDBACK_OPS
     match(op):
         case Op.KEY_WORDS:
             if md.verbose: print(f"{' ' * ctx.level} KEY_WORDS:{ctx.level} c: {ctx.cipher}, " \
                                  f"p: {ctx.plaintext}, kw: {ctx.key_words}, kp: {ctx.key_pfx}{', Once' if ctx.once else ''}")
-            key_word_generator = keyword_generator(ctx, md)
-            try:
-                key_words = next(key_word_generator)
-                while True:
-                    valid = True
-                    # TODO: save aggregate_len
-                    key_len = aggregate_len(ctx.key_words) + aggregate_len(key_words)
-                    if key_len > len(ctx.cipher):
-                        valid = yield from next_ciphers_for_key(key_words, ctx, md)
-                    elif key_len > aggregate_len(ctx.plain_words): # key_len == len(ctx.cipher)
-                        valid = yield from next_plaintext_for_key(key_words, ctx, md)
-                    else:
-                        yield final_context(None, key_words, ctx, md)
-                    if valid: any_valid = True
-                    if ctx.once: break
-                    key_words = key_word_generator.send(valid)
-            except StopIteration:
-                pass
-
+            frame.items = keyword_generator(ctx, md)
         case Op.CIPHERS_FOR_KEY:
             if md.verbose: print(f"{' ' * ctx.level} CIPHERS_FOR_KEY:{ctx.level} k: {ctx.key_words}")
-            any_valid = True
-            for cipher, fragments in generate_ciphers_for_key(ctx, md):
-                yield from next_plaintext_for_cipher(cipher, fragments, ctx, md)
-
+            frame.items = generate_ciphers_for_key(ctx, md)
         case Op.PLAINTEXT_WORDS:
             if md.verbose: print(f"{' ' * ctx.level} PLAINTEXT_WORDS:{ctx.level} p: {ctx.plaintext}, pp: {ctx.plain_pfx}")
-            any_valid = True
-            for plain_words, plain_pfx in generate_words(ctx, md.words):
-                add_key_words(ctx)
-                add_plain_words(ctx, plain_words, plain_pfx)
-                if plain_pfx:
-                    yield from next_plaintext_for_prefix(plain_words, plain_pfx, ctx, md)
-                else: # next_any_cipher()
-                    yield final_context(plain_words, None, ctx, md)
-
+            frame.items = generate_words(ctx, md.words)
         case Op.PLAINTEXT_FOR_PREFIX:
             if md.verbose: print(f"{' ' * ctx.level} PLAINTEXT_FOR_PREFIX:{ctx.level} pp: {ctx.plain_pfx}, c: {ctx.cipher}")
-            word_generator = generate_words_with_prefix(md.words.list, ctx.plain_pfx, aggregate_len(ctx.key_words))
-            try:
-                plain_word, once = next(word_generator)
-                while True:
-                    if md.verbose: print(f"{' ' * ctx.level} gen_wwp pp: {ctx.plain_pfx}, w: {plain_word}, c: {ctx.cipher}" \
-                                         f"{', Once' if once else ''}")
-                    valid = True
-                    plain_ctx = plain_word_ctx(plain_word, ctx, md, once)
-                    if len(plain_word) <= len(ctx.cipher):
-                        add_key_prefix(plain_ctx, md)
-                        valid = yield from generate_next(Op.KEY_WORDS, plain_ctx, md)
-                        #valid = yield from next_key_for_plain_word(plain_word, ctx, md)
-                    else:
-                        valid = yield from generate_next(Op.CIPHERS_FOR_PLAINTEXT, plain_ctx, md)
-                    if valid: any_valid = True
-                    if once: break
-                    plain_word, _ = word_generator.send(valid)
-            except StopIteration:
-                pass
-            
+            frame.items = generate_words_with_prefix(md.words, ctx.plain_pfx, aggregate_len(ctx.key_words))
         case Op.CIPHERS_FOR_PLAINTEXT:
             if md.verbose: print(f"{' ' * ctx.level} CIPHERS_FOR_PLAINTEXT:{ctx.level} p: {ctx.plaintext}")
-            #TODO: hardcoded literal value
-            cipher_generator = generate_ciphers_for_plaintext(ctx, md, aggregate_len(ctx.key_words) + 2)
+            frame.items = generate_ciphers_for_plaintext(ctx, md, aggregate_len(ctx.key_words) + 2)
+    return frame
+
+def push_frame(stack, op, ctx, md, results):
+    # Returns op's value if ctx is a dead context, else None
+    residue = context_residue(op, ctx, md)
+    if residue in dead_contexts:
+        dead_context_stats['hits'] += 1
+        dead_contexts.move_to_end(residue)
+        return dead_contexts[residue]
+    dead_context_stats['misses'] += 1
+    frame = open_frame(op, ctx, md)
+    frame.residue = residue
+    frame.results = results
+    stack.append(frame)
+    return None
+
+def pop_frame(stack, results):
+    frame = stack.pop()
+    if results == frame.results:
+        dead_contexts[frame.residue] = frame.any_valid
+        if len(dead_contexts) > MAX_DEAD_CONTEXTS:
+            dead_contexts.popitem(last=False)
+    return frame.any_valid
+
+def expand_item(frame, item, md):
+    # Returns the child of one item of frame's generator: (op, ctx) of a
+    # child op, (pkc, hdr) of a result, or the child's valid if it has
+    # neither.
+    ctx = frame.ctx
+    match(frame.op):
+        case Op.KEY_WORDS:
+            key_words = item
+            key_len = aggregate_len(ctx.key_words) + aggregate_len(key_words)
+            if key_len > len(ctx.cipher):
+                if not ctx.fragments:
+                    return False
+                return Op.CIPHERS_FOR_KEY, cipher_ctx_for_key(key_words, ctx, md)
+            elif key_len > aggregate_len(ctx.plain_words): # key_len == len(ctx.cipher)
+                return Op.PLAINTEXT_WORDS, plain_ctx_for_key(key_words, ctx, md)
+            return final_context(None, key_words, ctx, md)
+
+        case Op.CIPHERS_FOR_KEY:
+            cipher, fragments = item
+            return Op.PLAINTEXT_WORDS, plain_ctx_for_cipher(cipher, fragments, ctx, md)
+
+        case Op.PLAINTEXT_WORDS:
+            plain_words, plain_pfx = item
+            add_key_words(ctx)
+            add_plain_words(ctx, plain_words, plain_pfx)
+            if plain_pfx:
+                return Op.PLAINTEXT_FOR_PREFIX, prefix_ctx_for_words(plain_words, plain_pfx, ctx, md)
+            return final_context(plain_words, None, ctx, md)
+
+        case Op.PLAINTEXT_FOR_PREFIX:
+            plain_word, once = item
+            # the first word's once applies to all of them
+            if frame.once is None: frame.once = once
+            if md.verbose: print(f"{' ' * ctx.level} gen_wwp pp: {ctx.plain_pfx}, w: {plain_word}, c: {ctx.cipher}" \
+                                 f"{', Once' if frame.once else ''}")
+            plain_ctx = plain_word_ctx(plain_word, ctx, md, frame.once)
+            if len(plain_word) <= len(ctx.cipher):
+                plain_ctx = add_key_prefix(plain_ctx, md)
+                return Op.KEY_WORDS, plain_ctx
+            return Op.CIPHERS_FOR_PLAINTEXT, plain_ctx
+
+        case Op.CIPHERS_FOR_PLAINTEXT:
+            cipher, fragments, _ = item
+            return Op.KEY_WORDS, key_ctx_for_cipher(cipher, fragments, ctx, md)
+
+# Cursors of a search, for checkpoints. The generator of a frame is
+# deterministic given the values sent to it, so a frame is saved as those
+# values, and its generator rebuilt by sending them again; the child op of
+# each frame below the top one is its last item, expanded again. expanded
+# tells if the top frame's last item was expanded, to a result, before the
+# cursor was saved. Resumed frames are never recorded as dead contexts,
+# since the results under them before the cursor are not known.
+
+SENT_CODES = {None: 'n', True: 't', False: 'f'}
+SENT_VALUES = {code: value for value, code in SENT_CODES.items()}
+
+def frame_cursor(stack, expanded):
+    # the cursor of the frames on stack, as json
+    return {'expanded': expanded,
+            'frames': [{'sent': ''.join(SENT_CODES[value] for value in frame.sent),
+                        'once': frame.once, 'any_valid': frame.any_valid} for frame in stack]}
+
+def resume_frames(stack, op, ctx, md, cursor):
+    # Push the frames of cursor on stack and return the top frame's last
+    # item. The --show-words words were counted when the items were first
+    # expanded.
+    global all_key_words, all_plain_words
+    tables = all_key_words, all_plain_words
+    all_key_words = all_plain_words = None
+    try:
+        for depth, saved in enumerate(cursor['frames']):
+            frame = open_frame(op, ctx, md)
+            frame.residue = context_residue(op, ctx, md)
+            frame.results = -1
+            frame.once = saved['once']
+            frame.any_valid = saved['any_valid']
+            for code in saved['sent']:
+                frame.value = SENT_VALUES[code]
+                frame.sent.append(frame.value)
+                item = frame.items.send(frame.value)
+            stack.append(frame)
+            if depth + 1 < len(cursor['frames']):
+                op, ctx = expand_item(frame, item, md)
+    finally:
+        all_key_words, all_plain_words = tables
+    return item
+
+def iterate_next(op, ctx, md, pause=None, stack=None, cursor=None):
+    # With pause, None is yielded too every pause nodes, so the caller can
+    # do other work during long stretches without results. The frames are
+    # kept on stack, if given, so the caller can save a frame_cursor of it
+    # at a yield; with cursor, the search resumes from one.
+    if stack is None:
+        stack = []
+    results = 0
+    nodes = 0
+    item = None
+    if cursor is None:
+        valid = push_frame(stack, op, ctx, md, results)
+        if valid is not None:
+            return valid
+    else:
+        item = resume_frames(stack, op, ctx, md, cursor)
+        valid = None
+        if cursor['expanded']:
+            item, valid = None, True
+    while stack:
+        frame = stack[-1]
+        if item is None:
+            if valid is not None:
+                # the value of frame's last child
+                if frame.op in FEEDBACK_OPS:
+                    if valid: frame.any_valid = True
+                    if frame.once if frame.op is Op.PLAINTEXT_FOR_PREFIX else frame.ctx.once:
+                        valid = pop_frame(stack, results)
+                        continue
+                    frame.value = valid
+                valid = None
             try:
-                cipher, fragments, once = next(cipher_generator)
-                while True:
-                    key_ctx = key_ctx_for_cipher(cipher, fragments, ctx, md)
-                    valid = yield from generate_next(Op.KEY_WORDS, key_ctx, md)
-                    if valid: any_valid = True
-                    if ctx.once: break
-                    cipher, fragments, _ = cipher_generator.send(valid)
+                frame.sent.append(frame.value)
+                item = frame.items.send(frame.value)
             except StopIteration:
-                pass
+                valid = pop_frame(stack, results)
+                continue
+            if pause:
+                nodes += 1
+                if nodes % pause == 0:
+                    yield None
+        child = expand_item(frame, item, md)
+        item = None
+        if type(child) is bool:
+            valid = child
+        elif type(child[0]) is Op:
+            valid = push_frame(stack, child[0], child[1], md, results)
+        else:
+            results += 1
+            yield child
+            valid = True
+    return valid
 
-    ctx.level -= 1
-    return any_valid
+# Best-first search, for --bf. Nodes are expanded in the order of the score
+# of the text decoded up to them instead of depth first: the frontier is a
+# heap of the (op, ctx) children not expanded yet, and expanding a node
+# pushes all its children, or yields them if they are results. A feedback
+# op is sent True for each child, whose value is not known until it is
+# expanded. The frontier drops its worse half when it has more than
+# MAX_FRONTIER nodes, so very large searches become beam searches.
+
+MAX_FRONTIER = 1 << 18
+
+def node_score(scorer, ctx):
+    pkc = span_pkc(ctx.span)
+    return scorer.score(pkc.plaintext + (ctx.plaintext or ctx.plain_pfx or ""), pkc.key + ctx.key,
+                        pkc.plain_words)
 
-def md_init(args):
+def best_first_next(op, ctx, md, scorer):
+    frontier = [(0.0, 0, op, ctx)]
+    seq = 0
+    while frontier:
+        _, _, op, ctx = heapq.heappop(frontier)
+        frame = open_frame(op, ctx, md)
+        while True:
+            try:
+                item = frame.items.send(frame.value)
+            except StopIteration:
+                break
+            child = expand_item(frame, item, md)
+            if type(child) is bool:
+                pass
+            elif type(child[0]) is Op:
+                seq += 1
+                # of equal scores, the newest first, as depth first
+                heapq.heappush(frontier, (-node_score(scorer, child[1]), -seq, child[0], child[1]))
+            else:
+                yield child
+            if op in FEEDBACK_OPS:
+                if frame.once if op is Op.PLAINTEXT_FOR_PREFIX else ctx.once:
+                    break
+                frame.value = True
+        if len(frontier) > MAX_FRONTIER:
+            frontier = heapq.nsmallest(MAX_FRONTIER // 2, frontier)
+
+def md_init(args, quiet=False):
     wordlist = load_wordlist(args.dict, args.min_word_length)
-    words = Words(set=set(wordlist), list=wordlist)
+    words = make_words(wordlist)
     keywords = words
-    if args.kd:
+    # same file and filter as --dict: share the same Words
+    if args.kd and (args.kd, 1) != (args.dict, args.min_word_length):
         key_wordlist = load_wordlist(args.kd, 1) # min_key_len possibly
-        keywords = Words(set=set(key_wordlist), list=key_wordlist)
+        keywords = make_words(key_wordlist)
     md = Metadata(words=words, keywords=keywords, verbose=args.verbose, min_keylen=args.mk)
-    print(f"w: {len(md.words.list)}, kw: {len(md.keywords.list)}")
+    if not quiet: print(f"w: {len(md.words.list)}, kw: {len(md.keywords.list)}")
     return md
 
+def open_writer(args, offset=None):
+    # offset: resume writing a result file from there
+    if not args.output: return None
+    path = args.of or f"results.{args.output}"
+    if offset is not None:
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+    return ResultWriter(path, args.output, append=offset is not None)
+
+def emit_pkc(writer, pkc, hdr):
+    if writer:
+        writer.write(pkc, hdr)
+    else:
+        print_pkc(pkc, hdr)
+
+def new_plaintexts(results):
+    # the results whose plaintext differs from the result before
+    last_plain = None
+    for pkc, hdr in results:
+        if pkc.plaintext != last_plain:
+            yield pkc, hdr
+            last_plain = pkc.plaintext
+
+def top_results(results, scorer, k, quiet=True):
+    # The k best scored results with distinct plaintexts, best first, with
+    # their score added to hdr. With quiet, what the search prints is
+    # dropped.
+    top = TopK(k)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull if quiet else sys.stdout):
+        for pkc, hdr in results:
+            top.push(scorer.score_pkc(pkc), (pkc, hdr), pkc.plaintext)
+    for score, (pkc, hdr) in top.results():
+        yield pkc, f"{hdr} {score:.3f}"
+
 def print_pkc(pkc, hdr=None):
     if not pkc.plaintext and not pkc.key and not pkc.cipher: return
     if hdr: print(hdr, end=" ")
@@ -372,6 +668,21 @@ def test_generate_next_key3(fragments, md):
     for pkc, hdr in generate_next(Op.PLAINTEXT_WORDS, ctx, md):
         print_pkc(pkc, hdr)
 
+"""
+--
+p: thenet k: éclair c: nvhney
+"""
+def test_top_results():
+    # a key word with an accented letter is scored, not an error
+    wordlist = sorted(["éclair", "net", "the", "then"])
+    words = make_words(wordlist)
+    md = Metadata(words=words, keywords=words, verbose=False, min_keylen=3)
+    scorer = Scorer([0] * 26, [0] * 26 ** 2, [0] * 26 ** 3)
+    ctx = Context(key_words=[], cipher="nvhney", fragments=[])
+    print("--")
+    for pkc, hdr in top_results(iterate_next(Op.KEY_WORDS, ctx, md), scorer, 5):
+        print_pkc(pkc)
+
 def run_tests(args):
     fragments = ['qvu', 'bma', 'aps', 'e', 'tn', 'nc', 'sc', 'ngqzp']
     if args.fragments:
@@ -385,11 +696,11 @@ def run_tests(args):
     wordlist = [ "balls", "boobs", "bon", "bonfire", "bucket", "fire", "fiber", \
                  "fifteen", "epic", "snow", "soybean", "soy", "sir", "sire", "spy", "key" ]
     wordlist.sort()
-    wordset = set(wordlist)
-    words = Words(set=wordset,list=wordlist)
+    words = make_words(wordlist)
     md = Metadata(words=words, keywords=words, verbose=args.verbose, min_keylen=args.mk)
 
     test_generate_next_key(fragments, md)
+    test_top_results()
 
     md = md_init(args)
 
@@ -429,6 +740,193 @@ def get_fragments(args):
         fragments += args.af.split(',')
     return fragments
 
+# Multiprocess search. The first KEY_WORDS level is split into units of
+# one first key word each; unit results come back as each unit is done,
+# in unit order, which is the order the single process search produces
+# them in. The memo tables are the workers' own, so their stats are not
+# printed.
+
+worker_md = None
+
+def init_worker(args):
+    global worker_md
+    worker_md = md_init(args, quiet=True)
+    if args.show_words: collect_words(args.tw)
+    if args.stats: instrument()
+
+def search_unit(ctx):
+    # Returns the unit's results, each with the output printed before it,
+    # and the unit's word tables.
+    if all_key_words is not None:
+        all_key_words.clear()
+        all_plain_words.clear()
+    search_stats.clear()
+    results = []
+    with io.StringIO() as out, redirect_stdout(out):
+        for pkc, hdr in iterate_next(Op.KEY_WORDS, ctx, worker_md):
+            results.append((pkc, hdr, out.getvalue()))
+            out.seek(0)
+            out.truncate()
+        results.append((None, None, out.getvalue()))
+    return results, all_key_words, all_plain_words, search_stats
+
+def merge_words(key_words, plain_words):
+    if key_words is None: return
+    all_key_words.merge(key_words)
+    all_plain_words.merge(plain_words)
+
+def first_key_word_list(ctx, md):
+    candidates = first_key_word_candidates(ctx, md)
+    if candidates is None:
+        candidates = md.keywords.list
+    return [word for word in candidates if len(word) >= md.min_keylen]
+
+def generate_sharded(ctx, md, args, first_key_words, start=0):
+    # Yields (next_word, pkc, hdr) like generate_units
+    units = [ctx._replace(first_key_words=first_key_words[idx:idx + 1])
+             for idx in range(start, len(first_key_words))]
+    executor = ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args,))
+    try:
+        unit_results = executor.map(search_unit, units)
+        for idx, (results, key_words, plain_words, unit_stats) in enumerate(unit_results, start):
+            merge_words(key_words, plain_words)
+            search_stats.merge(unit_stats)
+            for pkc, hdr, output in results:
+                print(output, end="")
+                yield (idx, pkc, hdr) if pkc is not None else (idx + 1, None, None)
+    finally:
+        # don't search the units left when stopped early
+        executor.shutdown(cancel_futures=True)
+
+def generate_units(ctx, md, args, first_key_words, start=0, stack=None, cursor=None, pause=None):
+    # Search first_key_words[start:] one first key word at a time, yielding
+    # (next_word, pkc, hdr) for each result, where next_word is the index of
+    # the word being searched, and (next_word, None, None) after each unit,
+    # where next_word is the index of the next one. A unit searched in this
+    # process also yields (next_word, None, None) every pause nodes, with
+    # next_word the word being searched, and keeps its frames on stack. With
+    # cursor, the unit at start resumes from it, in this process even with
+    # workers.
+    def search_here(idx, cursor=None):
+        unit_ctx = ctx._replace(first_key_words=first_key_words[idx:idx + 1])
+        for result in iterate_next(Op.KEY_WORDS, unit_ctx, md, pause, stack, cursor):
+            yield (idx, None, None) if result is None else (idx, *result)
+        yield idx + 1, None, None
+
+    if cursor is not None:
+        yield from search_here(start, cursor)
+        start += 1
+    if args.workers > 1:
+        yield from generate_sharded(ctx, md, args, first_key_words, start)
+        return
+    for idx in range(start, len(first_key_words)):
+        yield from search_here(idx)
+
+# nodes between the checks for a checkpoint due, or an interrupt
+CHECKPOINT_PAUSE_NODES = 1000
+
+def search_signature(args, ctx, first_key_words):
+    return {
+        'cipher': ctx.cipher, 'key_words': ctx.key_words, 'key_pfx': ctx.key_pfx,
+        'plain_pfx': ctx.plain_pfx, 'fragments': ctx.fragments, 'dict': args.dict,
+        'kd': args.kd, 'min_word_length': args.min_word_length, 'mk': args.mk,
+        'first_key_words': len(first_key_words)
+    }
+
+def save_search(path, checkpoint, writer, args, stack, expanded):
+    # stack is empty between units, and in units searched by workers
+    checkpoint.cursor = frame_cursor(stack, expanded) if stack else None
+    if args.show_words and (stack or args.workers == 1):
+        checkpoint.key_words = all_key_words.to_dict()
+        checkpoint.plain_words = all_plain_words.to_dict()
+    if writer:
+        writer.flush()
+        checkpoint.output_offset = writer.file.tell()
+    sys.stdout.flush()
+    save_checkpoint(path, checkpoint)
+
+def search_checkpointed(ctx, md, args):
+    # find --cipher, saving a checkpoint to args.checkpoint (or the
+    # --resume file) every args.ci seconds and on interrupt. The search in
+    # this process is only stopped between nodes, where its frames are
+    # consistent: SIGINT is noted, and acted on at the next yield of
+    # generate_units, at most CHECKPOINT_PAUSE_NODES nodes later.
+    path = args.resume or args.checkpoint
+    first_key_words = first_key_word_list(ctx, md)
+    search = search_signature(args, ctx, first_key_words)
+    if args.resume:
+        checkpoint = load_checkpoint(path)
+        if checkpoint.search != search:
+            print(f"{path} is a checkpoint of a different search: {checkpoint.search}")
+            return
+        if args.show_words:
+            all_key_words.update(checkpoint.key_words)
+            all_plain_words.update(checkpoint.plain_words)
+        print(f"resuming at first key word {checkpoint.next_word} of {len(first_key_words)}, " \
+              f"results: {checkpoint.emitted}")
+    else:
+        checkpoint = Checkpoint(search=search)
+    writer = open_writer(args, checkpoint.output_offset)
+
+    interrupted = False
+    def interrupt(signum, frame):
+        nonlocal interrupted
+        interrupted = True
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+
+    stack = []
+    expanded = False
+    skip = checkpoint.emitted if checkpoint.cursor is None else 0
+    last_save = time.monotonic()
+    try:
+        for next_word, pkc, hdr in generate_units(ctx, md, args, first_key_words, checkpoint.next_word,
+                                                  stack, checkpoint.cursor, CHECKPOINT_PAUSE_NODES):
+            expanded = pkc is not None
+            if pkc is None:
+                if next_word != checkpoint.next_word:
+                    # the unit before next_word is done
+                    checkpoint.next_word = next_word
+                    checkpoint.emitted = 0
+                    if args.show_words and args.workers > 1:
+                        checkpoint.key_words = all_key_words.to_dict()
+                        checkpoint.plain_words = all_plain_words.to_dict()
+            elif skip:
+                # emitted before the checkpoint
+                skip -= 1
+            else:
+                checkpoint.emitted += 1
+                if pkc.plaintext != checkpoint.last_plain:
+                    emit_pkc(writer, pkc, hdr)
+                    checkpoint.last_plain = pkc.plaintext
+            if interrupted:
+                raise KeyboardInterrupt
+            if time.monotonic() - last_save >= args.ci:
+                save_search(path, checkpoint, writer, args, stack, expanded)
+                last_save = time.monotonic()
+    except KeyboardInterrupt:
+        # from SIGINT here, or from a worker between units
+        save_search(path, checkpoint, writer, args, stack, expanded)
+        print(f"\ninterrupted, resume with --resume {path}")
+        sys.exit(130)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        if writer: writer.close()
+    # the search is complete
+    if os.path.exists(path):
+        os.remove(path)
+
+def cipher_ctx(args, fragments):
+    # the Context of find --cipher
+    key_words = args.kw.split(',') if args.kw else []
+    #if args.kw: key_words = args.kw.split(',')
+    return Context(
+        cipher = args.cipher,
+        key_words = key_words,
+        key_pfx = args.kp,
+        plain_pfx = args.pp,
+        fragments = filter_fragments(args.cipher, fragments)
+    )
+
 def find(args):
     fragments = get_fragments(args)
     md = md_init(args)
@@ -450,21 +948,42 @@ def find(args):
             print(f"{used_cipher}{' ' * (pad - len(used_cipher))}: {plain}, f: {fragments}")
 
     elif args.cipher:
-        key_words = args.kw.split(',') if args.kw else []
-        #if args.kw: key_words = args.kw.split(',')
-        ctx = Context(
-            cipher = args.cipher,
-            key_words = key_words,
-            key_pfx = args.kp,
-            plain_pfx = args.pp,
-            fragments = filter_fragments(args.cipher, fragments)
-        )
+        ctx = cipher_ctx(args, fragments)
         print(f"f: {ctx.fragments}")
-        last_plain = None
-        for pkc, hdr in generate_next(Op.KEY_WORDS, ctx, md):
-            if pkc.plaintext != last_plain:
-                print_pkc(pkc, hdr)
-                last_plain = pkc.plaintext
+        if args.checkpoint or args.resume:
+            if args.top or args.bf or args.fixed:
+                print("--top, --bf and --fixed are not supported with --checkpoint or --resume")
+                return
+            search_checkpointed(ctx, md, args)
+        elif args.fixed and (args.kw or args.kp or args.pp):
+            print("--kw, --kp and --pp are not supported with --fixed")
+            return
+        else:
+            writer = open_writer(args)
+            scorer = load_scorer(args.corpus or args.dict, word_ranks=bool(args.corpus)) if args.top or args.bf else None
+            if args.fixed:
+                search = product_search(ctx.cipher, ctx.fragments, md)
+                print(f"product states: {sum(len(states) for states in search.states)}, results: {search.count()}")
+                results = search.results()
+            elif args.bf:
+                results = best_first_next(Op.KEY_WORDS, ctx, md, scorer)
+            elif args.workers > 1:
+                results = ((pkc, hdr) for _, pkc, hdr in generate_sharded(ctx, md, args, first_key_word_list(ctx, md))
+                           if pkc is not None)
+            else:
+                results = iterate_next(Op.KEY_WORDS, ctx, md)
+            results = new_plaintexts(results)
+            if args.top:
+                results = top_results(results, scorer, args.top, quiet=not args.verbose)
+            for pkc, hdr in results:
+                emit_pkc(writer, pkc, hdr)
+            if writer: writer.close()
+        # the product search uses none of the memo tables, and workers
+        # have their own
+        if args.fixed or args.workers > 1: return
+        print_dead_context_stats()
+        print_dead_state_stats()
+        print_key_candidate_stats()
 """
         for key_words in generate_key_words(ctx, md):
             key = join(key_words)
@@ -501,11 +1020,39 @@ def generate(args):
     )
     #print_ctx(ctx, "--")
     ctx.print("--")
-    for pkc, hdr in generate_next(get_op(args.generate), ctx, md):
-        print_pkc(pkc, hdr)
+    writer = open_writer(args)
+    for pkc, hdr in iterate_next(get_op(args.generate), ctx, md):
+        emit_pkc(writer, pkc, hdr)
+    if writer: writer.close()
+
+# whether instrument() has wrapped the globals; forked workers inherit the
+# parent's wrapped globals and must not wrap them again
+instrumented = False
+
+def instrument():
+    # Wrap the op dispatch, the op generators and decode_with_key to
+    # collect search_stats.
+    global instrumented
+    if instrumented:
+        return
+    instrumented = True
+    g = globals()
+    g['open_frame'] = search_stats.counted_op(open_frame)
+    for name in OP_GENERATORS.values():
+        g[name] = search_stats.timed_generator(name, g[name])
+    timed_decode = search_stats.timed_function("decode_with_key", decode_with_key)
+    g['decode_with_key'] = wordgen.decode_with_key = ciphergen.decode_with_key = timed_decode
+
+def print_stats(args):
+    if args.stats == "json":
+        search_stats.print_json(OP_GENERATORS)
+    else:
+        search_stats.print_table(OP_GENERATORS)
 
 def main():
     args = parse_args()
+    if args.show_words: collect_words(args.tw)
+    if args.stats: instrument()
 
     if not args.generate:
         if args.plain or args.key or args.cipher:
@@ -516,6 +1063,7 @@ def main():
         generate(args)
 
     if args.show_words: show_all_words()
+    if args.stats: print_stats(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+from math import factorial
+from product import ProductAutomaton
+
+# Fragment orders as paths in a pruned graph. A node is the set of product
+# automaton states (see product.py) the text read so far can end in, with
+# the fragments left; an edge reads one more fragment, and is pruned when
+# no state is left. Fragments with the same content are one fragment with
+# a count, so each distinct order, a multiset permutation, is a single
+# path. An order is complete when key and plaintext both end a word at the
+# end of the text.
+#
+# Junctions have no useful constraint on their own: with word boundaries
+# anywhere, the key and plaintext letters across any junction are almost
+# always some words' letters. What prunes is where the junction is, that
+# is, the states the text before it ends in. pairs is the table of the
+# fragments that can follow each fragment at the start of the text, and
+# transitions caches the edges out of every node met deeper.
+#
+# With a large dictionary the state sets grow fast, and following them
+# costs more than it prunes: past MAX_STATES states a node is untracked,
+# None, and every order through it is taken, as without pruning.
+
+MAX_STATES = 64
+
+def feasible(states):
+    return states is None or bool(states)
+
+def permutations(counts):
+    # the number of distinct orders of fragments with counts
+    total = factorial(sum(counts))
+    for count in counts:
+        total //= factorial(count)
+    return total
+
+class FragmentGraph:
+    def __init__(self, fragments, automaton, cipher=""):
+        self.automaton = automaton
+        self.fragments = list(dict.fromkeys(fragments)) # distinct, in first seen order
+        self.counts = tuple(fragments.count(fragment) for fragment in self.fragments)
+        self.start = automaton.step({automaton.start: automaton.start_state}, cipher)
+        self.transitions = {}
+        self.orders_below = {} # node -> number of complete orders from it
+        # pairs[i][j]: fragment j can follow fragment i at the start
+        self.pairs = []
+        for i, fragment in enumerate(self.fragments):
+            states = self.step(self.start, i)
+            self.pairs.append([feasible(states) and feasible(self.step(states, j))
+                               for j in range(len(self.fragments))])
+
+    def step(self, states, i):
+        if states is None: return None
+        key = (frozenset(states), i)
+        if key not in self.transitions:
+            next_states = self.automaton.step(states, self.fragments[i])
+            self.transitions[key] = next_states if len(next_states) <= MAX_STATES else None
+        return self.transitions[key]
+
+    def edges(self, states, counts, first=None):
+        # (fragment index, next states, next counts) of the edges out of a
+        # node; first is the fragment read from the start, if it is the only one
+        for i, count in enumerate(counts):
+            if not count: continue
+            if first is not None and not self.pairs[first][i]: continue
+            next_states = self.step(states, i)
+            if not feasible(next_states): continue
+            yield i, next_states, counts[:i] + (count - 1,) + counts[i + 1:]
+
+    def count(self):
+        # the number of complete orders
+        return self.orders_from(self.start, self.counts)
+
+    def orders_from(self, states, counts):
+        # the number of complete orders from a node
+        if states is None:
+            return permutations(counts)
+        if not any(counts):
+            return int(self.automaton.start in states)
+        node = (frozenset(states), counts)
+        total = self.orders_below.get(node)
+        if total is None:
+            total = sum(self.orders_from(next_states, next_counts)
+                        for _, next_states, next_counts in self.edges(states, counts))
+            self.orders_below[node] = total
+        return total
+
+    def orders(self):
+        # Yields each complete order, as a list of fragments, without dead
+        # ends: an edge is only taken if it leads to complete orders.
+        order = []
+
+        def paths(states, counts, first=None):
+            if not any(counts):
+                yield list(order)
+                return
+            for i, next_states, next_counts in self.edges(states, counts, first):
+                if not self.orders_from(next_states, next_counts):
+                    continue
+                order.append(self.fragments[i])
+                yield from paths(next_states, next_counts, i if not order[:-1] else None)
+                order.pop()
+
+        yield from paths(self.start, self.counts)
+
+def fragment_graph(fragments, md, cipher=""):
+    return FragmentGraph(fragments, ProductAutomaton(md.words, md.keywords, md.min_keylen), cipher)
@@ -4,6 +4,8 @@
 #include <string_view>
 #include <vector>
 #include <unordered_set>
+#include <set>
+#include <utility>
 #include <ranges>
 #include <algorithm>
 #include <fstream>
@@ -12,6 +14,13 @@
 #include <optional>
 #include <functional>
 #include <cassert>
+#include <atomic>
+#include <mutex>
+#include <thread>
+#include <getopt.h>
+#include <cerrno>
+#include <climits>
+#include <cstdlib>
 
 using StringCRef = std::reference_wrapper<const std::string>;
 
@@ -33,8 +42,13 @@ struct StringEqual {
 
 using UnorderedStringSet = std::unordered_set<std::string, StringHash, StringEqual>;
 
-int first_word_count{};
-uint64_t num_keys{};
+// The (key word, plaintext word) prefixes a text can end in, when it is
+// read from the start as key words and plaintext words.
+using JunctionState = std::pair<std::string, std::string>;
+using JunctionStates = std::set<JunctionState>;
+// Past this many states a prefix is not followed any further: every order
+// sharing it is searched, as if it had no junction pruning.
+constexpr size_t kMaxJunctionStates = 256;
 
 void print_words(
     std::string_view header, const std::vector<StringCRef>& words) {
@@ -112,31 +126,145 @@ struct DecodingResult {
         result_num(rn) {}
 };
 
+// Options of a run; see usage().
+struct Options {
+  std::vector<std::string> fragments = {
+      "qvu", "bma", "aps", "e", "tn", "sc", "nc", "xzfdq", "ngqzp"};
+  std::string dict_path = "./words";
+  size_t min_word_len = 1;
+  size_t max_word_len = 10;
+  int max_trigrams = 4;
+  unsigned num_threads = 1;
+};
+
+// The words, read once and shared by the decoders of every thread.
+struct Dictionary {
+  explicit Dictionary(const std::string& path) { load_wordlist(path); }
+
+  std::vector<std::string> wordlist;
+  std::vector<size_t> letter_start_indices;
+  UnorderedStringSet wordlist_set;
+  UnorderedStringSet prefix_set; // proper prefixes of words
+
+private:
+  auto is_all_alpha(const std::string& word) {
+    return std::find_if_not(word.begin(), word.end(), [](char c) {
+      return std::isalpha(c);
+    }) == word.end();
+  }
+
+  bool contains_any_of(std::string_view str, std::string_view letters) {
+    return std::ranges::any_of(str, [&letters](char c) {
+        return letters.find(c) != std::string_view::npos;
+    });
+  }
+
+  // The index of the first word of each letter in the sorted words, and
+  // their count last; a letter no word starts with has an empty range.
+  auto build_alphabet_index(const std::vector<std::string>& words) {
+    std::vector<size_t> indices(27);
+    size_t i{};
+    for (char letter = 'a'; letter <= 'z'; ++letter) {
+      while (i < words.size() && words[i][0] < letter) ++i;
+      indices[letter - 'a'] = i;
+    }
+    indices[26] = words.size();
+    return indices;
+  }
+
+  void load_wordlist(const std::string& path) {
+    std::ifstream file(path);
+    if (!file) {
+      throw std::runtime_error("Failed to open wordlist file: " + path);
+    }
+    std::string word;
+    while (std::getline(file, word)) {
+      word.erase(0, word.find_first_not_of(" \t\n\r\f\v"));
+      word.erase(word.find_last_not_of(" \t\n\r\f\v") + 1);
+      if (!word.empty() && (word.length() >= 3) && is_all_alpha(word)
+          && contains_any_of(word, "aeiouy")) {
+        wordlist.push_back(std::move(word));
+      }
+    }
+    std::vector<std::string> small_words = {"a", "in", "on", "of", "by", "to",
+        "up", "at", "or", "it", "an", "no", "do", "be", "go", "is", "as"};
+    for (const auto& word: small_words) {
+      wordlist.push_back(word);
+    }
+    // TODO: insert(begin, end)?
+    for (const auto& word: wordlist) {
+        wordlist_set.insert(word);
+        for (size_t len = 1; len < word.length(); ++len) {
+          prefix_set.insert(word.substr(0, len));
+        }
+    }
+    std::ranges::sort(wordlist);
+    wordlist.erase(std::ranges::unique(wordlist).begin(), wordlist.end());
+    letter_start_indices = build_alphabet_index(wordlist);
+  }
+};
+
+// The index of the first fragment with the same content, for each fragment:
+// fragments with the same content have the same value, so next_permutation
+// only visits distinct orders.
+std::vector<int> canonical_indices(const std::vector<std::string>& fragments) {
+  std::vector<int> indices;
+  for (const auto& frag: fragments) {
+    auto first = std::ranges::find(fragments, frag) - fragments.begin();
+    indices.push_back(static_cast<int>(first));
+  }
+  std::ranges::sort(indices);
+  return indices;
+}
+
+std::atomic<uint64_t> num_perms{};
+std::atomic<uint64_t> num_pruned{};
+
 class TextDecoder {
 public:
-  TextDecoder(const std::vector<std::string>& fragments,
-      const std::string& wordlist_path, size_t min_word_length = 1)
-      : fragments_(fragments), min_word_len_(min_word_length) {
+  TextDecoder(const Options& options, const Dictionary& dict)
+      : fragments_(options.fragments), wordlist_(dict.wordlist),
+        letter_start_indices_(dict.letter_start_indices),
+        wordlist_set_(dict.wordlist_set), prefix_set_(dict.prefix_set),
+        min_word_len_(options.min_word_len), max_word_len_(options.max_word_len),
+        max_decoded_trigrams_(options.max_trigrams),
+        canonical_(canonical_indices(fragments_)) {
     target_len_ = std::accumulate(fragments_.begin(), fragments_.end(), 0ULL,
         [](size_t sum, const std::string& s) { return sum + s.length(); });
 
     // Pre-allocate working vectors
     current_key_words_.reserve(target_len_);
     current_valid_words_.reserve(target_len_);
-    std::vector<StringCRef> cp;
-    for (int idx{}; const auto& frag: fragments_) {
-      current_permutation_.push_back(idx++);
-    }
-    load_wordlist(wordlist_path);
+    junctions_.resize(fragments_.size() + 1);
+    junctions_[0] = {{"", ""}};
+    tracked_.resize(fragments_.size() + 1);
+    tracked_[0] = true;
   }
 
-  Generator<DecodingResult> process_all() {
-    int num_perms{};
+  // The results of the orders of the fragments that start with prefix,
+  // fragment indices as canonical_indices() gives them.
+  Generator<DecodingResult> process_all(const std::vector<int>& prefix) {
+    current_permutation_ = prefix;
+    auto rest = canonical_;
+    for (auto idx : prefix) { rest.erase(std::ranges::find(rest, idx)); }
+    current_permutation_.insert(current_permutation_.end(), rest.begin(), rest.end());
+    auto suffix = current_permutation_.begin() + prefix.size();
     do {
+      // read the fragments that changed since the last order; when a prefix
+      // of the order leaves no junction states, skip every order sharing it
+      // by moving to its last one
+      auto depth = read_fragments();
+      if (depth < current_permutation_.size()) {
+        ++num_pruned;
+        if (depth < prefix.size()) break;
+        std::sort(current_permutation_.begin() + depth + 1, current_permutation_.end(),
+            std::greater<>());
+        continue;
+      }
+      if (tracked_.back() && !junctions_.back().contains({"", ""})) continue;
       reset_perm_state();
       if (!(++num_perms % 100)) {
-        printf("\rperms: %d", num_perms);
-        fflush(stdout);
+        fprintf(stderr, "\rperms: %llu", static_cast<unsigned long long>(num_perms));
       }
       std::string encoded;
       encoded.reserve(target_len_);
@@ -144,36 +272,34 @@ public:
         encoded += fragments_[idx];
       }
       //printf("frags: %s\n", encoded.c_str());
-      int num_valid_keys{};
-      for (auto maybe_result = generate_key_combinations(encoded, 0);
-          maybe_result.has_value();
-          maybe_result = try_next_combination(encoded)) {
-        /*
-        ++num_valid_keys;
-        if (!(num_keys % 100)) {
-          printf("\r keys: %d", num_valid_keys);
-          fflush(stdout);
-        }
-        */
-        co_yield std::move(*maybe_result);
+      auto results = generate_key_combinations(encoded, 0);
+      while (results.next()) {
+        co_yield results.current_value();
       }
-    } while (std::ranges::next_permutation(current_permutation_).found);
+    } while (std::next_permutation(suffix, current_permutation_.end()));
   }
 
 private:
   const std::vector<std::string>& fragments_;
-  std::vector<std::string> wordlist_;
-  std::vector<size_t> letter_start_indices_;
-  UnorderedStringSet wordlist_set_;
+  const std::vector<std::string>& wordlist_;
+  const std::vector<size_t>& letter_start_indices_;
+  const UnorderedStringSet& wordlist_set_;
+  const UnorderedStringSet& prefix_set_; // proper prefixes of words
   size_t target_len_;
   size_t min_word_len_;
-  size_t max_word_len_ = 10;
+  size_t max_word_len_;
   int result_num_;
-  int max_decoded_trigrams_ = 4;
+  int max_decoded_trigrams_;
   int num_decoded_trigrams_;
+  const std::vector<int> canonical_;
 
   // Working vectors that we'll reuse
   std::vector<int> current_permutation_;
+  // junctions_[i] are the states after the first i fragments of read_, if
+  // tracked_[i]
+  std::vector<JunctionStates> junctions_;
+  std::vector<bool> tracked_;
+  std::vector<int> read_;
   std::vector<StringCRef> current_key_words_;
   std::vector<StringCRef> current_valid_words_;
 
@@ -182,66 +308,67 @@ private:
       result_num_ = 0;
   }
 
-  auto is_all_alpha(const std::string& word) {
-    return std::find_if_not(word.begin(), word.end(), [](char c) {
-      return std::isalpha(c);
-    }) == word.end();
-  }
-
-  bool contains_any_of(std::string_view str, std::string_view letters) {
-    return std::ranges::any_of(str, [&letters](char c) {
-        return letters.find(c) != std::string_view::npos;
-    });
-  }
-
-  auto build_alphabet_index(const std::vector<std::string>& words) {
-    std::vector<size_t> indices(27);
-    char next_letter = 'a';
-    for (size_t i{}; i < words.size(); ++i) {
-      char first_char = words[i][0];
-      if (first_char >= next_letter) {
-        indices[first_char - 'a'] = i;
-        next_letter = first_char + 1;
+  // The states after reading fragment from states: a key letter is kept if
+  // the key word and the plaintext word it decodes both stay words or word
+  // prefixes, as generate_key_combinations and find_solution need them.
+  JunctionStates read_fragment(const JunctionStates& states, std::string_view fragment) {
+    JunctionStates current = states;
+    for (auto c : fragment) {
+      JunctionStates next;
+      for (const auto& [key, plain] : current) {
+        for (char k = 'a'; k <= 'z'; ++k) {
+          auto next_key = key + k;
+          bool key_continues = prefix_set_.contains(next_key);
+          bool key_ends = wordlist_set_.contains(next_key);
+          if (!key_continues && !key_ends) continue;
+          auto next_plain = plain + static_cast<char>((k - c + 26) % 26 + 'a');
+          bool plain_continues = next_plain.length() < max_word_len_
+              && prefix_set_.contains(next_plain);
+          bool plain_ends = next_plain.length() >= min_word_len_
+              && next_plain.length() <= max_word_len_ && wordlist_set_.contains(next_plain);
+          auto add_states = [&](const std::string& next_key_state) {
+            if (plain_continues) next.emplace(next_key_state, next_plain);
+            if (plain_ends) next.emplace(next_key_state, "");
+          };
+          if (key_continues) add_states(next_key);
+          if (key_ends) add_states("");
+        }
       }
+      current = std::move(next);
+      if (current.empty()) break;
     }
-    indices[26] = words.size();
-    assert(std::find(std::next(indices.begin()), indices.end(), 0) == indices.end());
-    return indices;
+    return current;
   }
 
-  void load_wordlist(const std::string& path) {
-    std::ifstream file(path);
-    if (!file) {
-      throw std::runtime_error("Failed to open wordlist file: " + path);
-    }
-    std::string word;
-    while (std::getline(file, word)) {
-      word.erase(0, word.find_first_not_of(" \t\n\r\f\v"));
-      word.erase(word.find_last_not_of(" \t\n\r\f\v") + 1);
-      if (!word.empty() && (word.length() >= 3) && is_all_alpha(word)
-          && contains_any_of(word, "aeiouy")) {
-        wordlist_.push_back(std::move(word));
+  // Read current_permutation_ into junctions_, from the first fragment that
+  // differs from read_. Returns the number of fragments read, less than all
+  // of them if a prefix has no states.
+  size_t read_fragments() {
+    size_t depth{};
+    while (depth < read_.size() && read_[depth] == current_permutation_[depth]) ++depth;
+    read_.resize(depth);
+    for (; depth < current_permutation_.size(); ++depth) {
+      auto idx = current_permutation_[depth];
+      tracked_[depth + 1] = tracked_[depth];
+      if (tracked_[depth]) {
+        junctions_[depth + 1] = read_fragment(junctions_[depth], fragments_[idx]);
+        if (junctions_[depth + 1].empty()) break;
+        if (junctions_[depth + 1].size() > kMaxJunctionStates) {
+          tracked_[depth + 1] = false;
+          junctions_[depth + 1].clear();
+        }
       }
+      read_.push_back(idx);
     }
-    std::vector<std::string> small_words = {"a", "in", "on", "of", "by", "to",
-        "up", "at", "or", "it", "an", "no", "do", "be", "go", "is", "as"};
-    for (const auto& word: small_words) {
-      wordlist_.push_back(word);
-    }
-    // TODO: insert(begin, end)?
-    for (const auto& word: wordlist_) {
-        wordlist_set_.insert(word);
-    }
-    std::ranges::sort(wordlist_);
-    letter_start_indices_ = build_alphabet_index(wordlist_);
+    return depth;
   }
 
-  bool add_key_word(
-      const std::string& word, const std::string& encoded, size_t length) {
+  // Adds word to the key and checks the plaintext the key decodes so far.
+  bool add_key_word(const std::string& word, const std::string& encoded) {
     current_key_words_.emplace_back(std::cref(word));
     std::string key;
     for (const auto& word : current_key_words_) { key += word; }
-    auto decoded = decode_with_key(encoded, key);
+    auto decoded = decode_with_key(encoded.substr(0, key.length()), key);
     return verify_decoded_text(decoded);
   }
 
@@ -249,7 +376,9 @@ private:
     current_key_words_.pop_back();
   }
 
-  std::optional<DecodingResult>
+  // Every key of words after current_key_words_ that decodes encoded to
+  // plaintext words, in word order.
+  Generator<DecodingResult>
   generate_key_combinations(const std::string& encoded, size_t current_length) {
     const bool log = false;
     if (current_length == target_len_) {
@@ -263,57 +392,27 @@ private:
       if constexpr (log) printf(": %s\n", key.c_str());
       auto decoded = decode_with_key(encoded, key);
       if (verify_decoded_text(decoded)) {
-        return DecodingResult(encoded, current_key_words_, std::move(decoded),
+        co_yield DecodingResult(encoded, current_key_words_, std::move(decoded),
             current_valid_words_, ++result_num_);
       }
-
-      return std::nullopt;
+      co_return;
     }
 
     size_t remaining = target_len_ - current_length;
-    if (remaining < min_word_len_) { return std::nullopt; }
+    if (remaining < min_word_len_) { co_return; }
 
-    for (const auto& word : wordlist_set_) {
+    for (const auto& word : wordlist_) {
       if (word.length() <= remaining) {
-        if (add_key_word(word, encoded, current_length)) {
-          auto result = generate_key_combinations(
+        if (add_key_word(word, encoded)) {
+          auto results = generate_key_combinations(
               encoded, current_length + word.length());
-          if (result.has_value()) { return result; }
+          while (results.next()) {
+            co_yield results.current_value();
+          }
         }
         remove_key_word();
       }
     }
-    return std::nullopt;
-  }
-
-  std::optional<DecodingResult>
-  try_next_combination(const std::string& encoded) {
-    if (current_key_words_.size() < 2) { return std::nullopt; }
-
-    //print_words("next keys", current_key_words_);
-
-    // Remove last word and calculate new length
-    size_t current_length = target_len_;
-    current_length -= current_key_words_.back().get().length();
-    current_key_words_.pop_back();
-
-    // Try combinations with the next words
-    auto it = wordlist_set_.find(current_key_words_.back().get());
-    current_length -= current_key_words_.back().get().length();
-    current_key_words_.pop_back();
-
-    assert(it != wordlist_set_.end());
-    for (++it; it != wordlist_set_.end(); ++it) {
-      if (it->length() <= target_len_ - current_length) {
-        if (add_key_word(*it, encoded, current_length)) {
-          auto result =
-              generate_key_combinations(encoded, current_length + it->length());
-          if (result.has_value()) { return result; }
-        }
-        remove_key_word();
-      }
-    }
-    return std::nullopt;
   }
 
   std::string decode_with_key(
@@ -349,12 +448,14 @@ private:
     current_valid_words_.pop_back();
   }
 
+  // True if text, the plaintext after the first length letters, is words,
+  // or, if it does not reach the end, words and the start of a word.
   bool find_solution(std::string_view text, size_t length = 0) {
-    assert(!text.empty());
     assert(length < target_len_);
-    if (text.length() < min_word_len_) return false;
+    if (text.empty()) return true;
 
     auto is_candidate = text.length() + length == target_len_;
+    if (is_candidate && (text.length() < min_word_len_)) return false;
     auto max = std::min(max_word_len_, text.length());
     if (is_candidate && (max < min_word_len_)) return false;
     for (size_t word_len = min_word_len_; word_len <= max; ++word_len) {
@@ -364,7 +465,7 @@ private:
       auto it = wordlist_set_.find(text.substr(0, word_len));
       if (it != wordlist_set_.end()) {
         auto new_length = length + it->length();
-        if (new_length == target_len_) return true;
+        if (new_length == target_len_) return add_valid_word(*it);
         if (add_valid_word(*it)) {
           if (find_solution(text.substr(it->length()), new_length)) return true;
           remove_last_valid_word();
@@ -395,28 +496,199 @@ private:
   }
 };
 
-int main(int argc, char* argv[]) {
-  std::vector<std::string> fragments = {
-      "qvu", "bma", "aps", "e", "tn", "sc", "nc", "xzfdq", "ngqzp"};
-//      "xzfdq", "ngqzp"};
-//      "qvu", "bma", "aps", "xzfdq", "ngqzp"};
+// Writes each piece of output in one call, from any thread.
+class Writer {
+public:
+  explicit Writer(FILE* file) : file_(file) {}
 
-  int min_letters = 1;
-  if (argc > 1) {
-    min_letters = atoi(argv[1]);
+  void write(std::string_view text) {
+    std::lock_guard lock(mutex_);
+    fwrite(text.data(), 1, text.size(), file_);
   }
 
-  //  std::string dict_path = "/usr/share/dict/words";
-  std::string dict_path = "./words";
-  TextDecoder decoder(fragments, dict_path, min_letters);
+private:
+  std::mutex mutex_;
+  FILE* file_;
+};
+
+// The output of one thread, written to a Writer when it reaches
+// kFlushSize bytes. flush_if_full is only called between orders, so the
+// results of an order are written together.
+class BufferedWriter {
+public:
+  static constexpr size_t kFlushSize = 1 << 16;
+
+  explicit BufferedWriter(Writer& writer) : writer_(writer) {}
+  ~BufferedWriter() { flush(); }
 
-  auto results = decoder.process_all();
-  while (results.next()) {
-    auto decoded = results.current_value();
-    if (decoded.result_num == 1) { printf("Encoded: %s\n", decoded.encoded.c_str()); }
-    printf("Decoded: %s", decoded.text.c_str());
-    print_words(": ", decoded.valid_words);
-    print_words("   keys", decoded.key_words);
+  void append(std::string_view text) { buffer_ += text; }
+
+  void append_words(std::string_view header, const std::vector<StringCRef>& words) {
+    buffer_ += header;
+    buffer_ += ": ";
+    for (const auto word : words) {
+      buffer_ += word.get();
+      buffer_ += ' ';
+    }
+    buffer_ += '\n';
+  }
+
+  void flush_if_full() {
+    if (buffer_.size() >= kFlushSize) flush();
+  }
+
+  void flush() {
+    writer_.write(buffer_);
+    buffer_.clear();
+  }
+
+private:
+  Writer& writer_;
+  std::string buffer_;
+};
+
+// The distinct prefixes of the fragment orders, in order, with the fewest
+// fragments that makes at least num_shards of them.
+std::vector<std::vector<int>> shard_prefixes(
+    const std::vector<int>& canonical, size_t num_shards) {
+  std::vector<std::pair<int, int>> counts; // fragment index, fragments left
+  for (auto idx : canonical) {
+    if (counts.empty() || counts.back().first != idx) counts.emplace_back(idx, 0);
+    ++counts.back().second;
+  }
+  std::vector<std::vector<int>> prefixes;
+  std::vector<int> prefix;
+  std::function<void(size_t)> add_prefixes = [&](size_t depth) {
+    if (prefix.size() == depth) {
+      prefixes.push_back(prefix);
+      return;
+    }
+    for (auto& [idx, count] : counts) {
+      if (!count) continue;
+      --count;
+      prefix.push_back(idx);
+      add_prefixes(depth);
+      prefix.pop_back();
+      ++count;
+    }
+  };
+  for (size_t depth{}; depth <= canonical.size(); ++depth) {
+    prefixes.clear();
+    add_prefixes(depth);
+    if (prefixes.size() >= num_shards) break;
+  }
+  return prefixes;
+}
+
+// Decodes the shards from next_shard on, until there are none left.
+void decode_shards(const Options& options, const Dictionary& dict,
+    const std::vector<std::vector<int>>& shards, std::atomic<size_t>& next_shard,
+    Writer& writer) {
+  TextDecoder decoder(options, dict);
+  BufferedWriter out(writer);
+  for (size_t shard; (shard = next_shard++) < shards.size();) {
+    auto results = decoder.process_all(shards[shard]);
+    while (results.next()) {
+      const auto& decoded = results.current_value();
+      if (decoded.result_num == 1) {
+        out.flush_if_full();
+        out.append("Encoded: ");
+        out.append(decoded.encoded);
+        out.append("\n");
+      }
+      out.append("Decoded: ");
+      out.append(decoded.text);
+      out.append_words("", decoded.valid_words);
+      out.append_words("   keys", decoded.key_words);
+    }
+  }
+}
+
+// Build with: g++ -std=c++20 -O2 -pthread -o perms perms.cpp
+void usage(const char* name) {
+  fprintf(stderr,
+      "usage: %s [-d dict] [-f fragment,...] [-m min_word_length]\n"
+      "       [--mx max_word_length] [-t max_trigrams] [-j threads, 0 for all cores]\n"
+      "       [min_word_length]\n", name);
+}
+
+// The non-negative number arg, or nullopt if it is not one.
+std::optional<unsigned> parse_count(const char* arg) {
+  char* end;
+  errno = 0;
+  long value = strtol(arg, &end, 10);
+  if (end == arg || *end || errno || value < 0 || value > INT_MAX) return std::nullopt;
+  return static_cast<unsigned>(value);
+}
+
+int main(int argc, char* argv[]) {
+  Options options;
+  const option long_options[] = {
+      {"dict", required_argument, nullptr, 'd'},
+      {"fragments", required_argument, nullptr, 'f'},
+      {"min-word-length", required_argument, nullptr, 'm'},
+      {"mx", required_argument, nullptr, 'x'}, // max-word-length
+      {"trigrams", required_argument, nullptr, 't'},
+      {"threads", required_argument, nullptr, 'j'},
+      {nullptr, 0, nullptr, 0}};
+  for (int opt; (opt = getopt_long(argc, argv, "d:f:m:x:t:j:", long_options, nullptr)) != -1;) {
+    switch (opt) {
+      case 'd': options.dict_path = optarg; break;
+      case 'f':
+        options.fragments.clear();
+        for (auto fragment : std::string_view(optarg) | std::views::split(',')) {
+          options.fragments.emplace_back(fragment.begin(), fragment.end());
+        }
+        break;
+      case 'm': case 'x': case 't': case 'j': {
+        auto count = parse_count(optarg);
+        if (!count) {
+          fprintf(stderr, "%s: invalid number: %s\n", argv[0], optarg);
+          return 2;
+        }
+        if (opt == 'm') options.min_word_len = *count;
+        else if (opt == 'x') options.max_word_len = *count;
+        else if (opt == 't') options.max_trigrams = *count;
+        else options.num_threads = *count;
+        break;
+      }
+      default: usage(argv[0]); return 2;
+    }
+  }
+  // the minimum word length as the only argument, as before options
+  if (optind < argc) {
+    auto count = parse_count(argv[optind]);
+    if (!count) {
+      fprintf(stderr, "%s: invalid number: %s\n", argv[0], argv[optind]);
+      return 2;
+    }
+    options.min_word_len = *count;
+    ++optind;
+  }
+  if (optind < argc || options.fragments.empty()
+      || options.max_word_len < options.min_word_len) {
+    usage(argv[0]);
+    return 2;
+  }
+  if (!options.num_threads) {
+    options.num_threads = std::max(1u, std::thread::hardware_concurrency());
+  }
+
+  Dictionary dict(options.dict_path);
+  // several shards per thread, so threads that finish early take more
+  auto shards = shard_prefixes(canonical_indices(options.fragments),
+      8 * options.num_threads);
+  std::atomic<size_t> next_shard{};
+  Writer writer(stdout);
+  {
+    std::vector<std::jthread> threads;
+    for (unsigned i{}; i < options.num_threads; ++i) {
+      threads.emplace_back(decode_shards, std::cref(options), std::cref(dict),
+          std::cref(shards), std::ref(next_shard), std::ref(writer));
+    }
   }
+  fprintf(stderr, "\r");
+  printf("perms: %llu, pruned prefixes: %llu\n",
+      static_cast<unsigned long long>(num_perms), static_cast<unsigned long long>(num_pruned));
   return 0;
 }
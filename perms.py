@@ -3,6 +3,7 @@ from wordgen import generate_words
 from ciphergen import generate_ciphers
 from codec import decode_with_key, find_key
 from util import aggregate_len, safe_len, load_wordlist
+from trie import Trie, END
 
 # NOTE: this doesn't handle case where --uc ends in 'n'; it will
 #       not differentiate between 'nc' and 'ngqzp'. we'd need a
@@ -53,36 +54,31 @@ class WordFinder:
         self.fragments = fragments
         self.wordlist = wordlist
         self.word_set = set(wordlist)
+        self.trie = Trie(wordlist)
         self.plain_pfx = args.pp
         self.key_pfx = args.kp
         self.min_word_length = args.min_word_length
         self.max_word_length = 10
 
-    def find_first(self, pfx):
-        for i, s in enumerate(self.wordlist):
-            if s.startswith(pfx):
-                return i
-        return None
-
     def contains_words_and_word_prefix(self, letters, words):
         if len(letters) < 2: 
             return (True, words, letters)
-        pfx = letters[:2]
-        idx = self.find_first(pfx)
-        if idx is not None:
-            while idx < len(self.wordlist) and self.wordlist[idx].startswith(pfx):
-                word = self.wordlist[idx]
-                if word.startswith(letters):
-                    if len(word) == len(letters):
-                        words.append(word)
-                        return (True, words, None)
-                    else:
-                        return (True, words, letters)
-                if letters.startswith(word):
-                    words.append(word)
-                    return self.contains_words_and_word_prefix(letters[len(word):], words)
-                idx += 1
-        return (False, [], None)
+        # in wordlist order: the shortest word that letters starts with,
+        # then letters as a word, then letters as a prefix
+        node = self.trie.find(letters[:2])
+        for i in range(2, len(letters)):
+            if node is None:
+                break
+            if END in node:
+                words.append(letters[:i])
+                return self.contains_words_and_word_prefix(letters[i:], words)
+            node = node.get(letters[i])
+        if node is None:
+            return (False, [], None)
+        if END in node:
+            words.append(letters)
+            return (True, words, None)
+        return (True, words, letters)
 
     def find_all_words(self):
         print(f"{type(self.wordlist)}: {len(self.wordlist)}")
@@ -108,12 +104,7 @@ class WordFinder:
         if not fragments: return
         for frag in fragments:
             cipher = cipher_pfx + frag
-            plain_idx = self.find_first(plain_pfx)
-            if plain_idx is None:
-                continue
-            while plain_idx < len(self.wordlist) and self.wordlist[plain_idx].startswith(plain_pfx):
-                plain = self.wordlist[plain_idx]
-                plain_idx += 1
+            for plain in self.trie.completions(plain_pfx):
                 key = find_key(plain, cipher)
                 #print(f"plain: {plain}, key: {key}")
                 for key_words, key_remain in generate_words(key_pfx + key, self.word_set, self.wordlist):
@@ -0,0 +1,172 @@
+from bisect import bisect_left
+from codec import LETTERS
+from context import Pkc
+from trie import END, is_prefix_node
+
+# Product automaton search of a cipher in one fixed fragment order. Key and
+# plaintext are read one letter at a time in lockstep, each in its own
+# dictionary trie: the state after a position is the key trie node, the
+# length of the key word so far (up to min_keylen) and the plaintext trie
+# node, where a root node means a word just ended. Every key letter that
+# has a child in the key trie decodes the cipher letter to the plaintext
+# letter, which must have a child in the plaintext trie, so a position only
+# advances when both sides stay feasible.
+#
+# The forward pass builds the states of every position and the edges
+# between them; the backward pass counts, for each state, the results
+# reachable from it, and drops the edges to states with none. Results are
+# then enumerated without dead ends.
+#
+# As in generate_next, the key and plaintext of a result are sequences of
+# complete words, as long as each other and at least as long as the cipher
+# the fragments are added to; the result's cipher is that cipher plus the
+# fewest fragments covering them.
+
+def state_id(state):
+    key_node, key_len, plain_node = state
+    return (id(key_node), key_len, id(plain_node))
+
+class ProductAutomaton:
+    def __init__(self, words, keywords, min_keylen):
+        self.plain_root = words.trie.root
+        self.key_root = keywords.trie.root
+        self.min_keylen = min_keylen
+        self.start_state = (self.key_root, 0, self.plain_root)
+        self.start = state_id(self.start_state)
+
+    def successors(self, state, c):
+        # (key letter, plaintext letter, key word ended, plaintext word
+        # ended, next state) of each key letter that keeps both sides feasible
+        key_node, key_len, plain_node = state
+        key_len = min(key_len + 1, self.min_keylen)
+        for k, key_child in key_node.items():
+            if k == END: continue
+            p = LETTERS[(ord(k) - c) % 26]
+            plain_child = plain_node.get(p)
+            if plain_child is None: continue
+            keys = []
+            if is_prefix_node(key_child):
+                keys.append((False, key_child, key_len))
+            if END in key_child and key_len == self.min_keylen:
+                keys.append((True, self.key_root, 0))
+            plains = []
+            if is_prefix_node(plain_child):
+                plains.append((False, plain_child))
+            if END in plain_child:
+                plains.append((True, self.plain_root))
+            for key_end, key_next, next_len in keys:
+                for plain_end, plain_next in plains:
+                    yield k, p, key_end, plain_end, (key_next, next_len, plain_next)
+
+    def step(self, states, text):
+        # the states (id -> state) reached from states by reading text
+        for c in text:
+            c = ord(c)
+            next_states = {}
+            for state in states.values():
+                for *_, next_state in self.successors(state, c):
+                    next_states[state_id(next_state)] = next_state
+            states = next_states
+            if not states: break
+        return states
+
+class ProductSearch:
+    def __init__(self, text, bounds, fragments, automaton):
+        self.text = text
+        # where the cipher and each fragment after it end in text
+        self.bounds = bounds
+        self.fragments = fragments
+        self.automaton = automaton
+        self.start = automaton.start
+        self.forward()
+        self.backward()
+
+    def forward(self):
+        # states[i] maps the id of each state reached after i letters to it;
+        # edges[i] maps it to its edges to states[i + 1]
+        self.states = [{self.start: self.automaton.start_state}]
+        self.edges = []
+        for i in range(len(self.text)):
+            c = ord(self.text[i])
+            next_states = {}
+            edges = {}
+            for sid, state in self.states[i].items():
+                state_edges = edges[sid] = []
+                for k, p, key_end, plain_end, next_state in self.automaton.successors(state, c):
+                    next_sid = state_id(next_state)
+                    next_states[next_sid] = next_state
+                    state_edges.append((k, p, key_end, plain_end, next_sid))
+            self.states.append(next_states)
+            self.edges.append(edges)
+            if not next_states: break
+
+    def is_end(self, i, sid):
+        # both sides end a word after the cipher
+        return i >= max(self.bounds[0], 1) and sid == self.start
+
+    def backward(self):
+        # counts[i] maps each state of position i to its number of results
+        self.counts = [{} for _ in self.states]
+        for i in reversed(range(len(self.states))):
+            counts = self.counts[i]
+            next_counts = self.counts[i + 1] if i < len(self.edges) else {}
+            for sid in self.states[i]:
+                count = 1 if self.is_end(i, sid) else 0
+                if i < len(self.edges):
+                    live = [edge for edge in self.edges[i][sid] if edge[4] in next_counts]
+                    self.edges[i][sid] = live
+                    count += sum(next_counts[edge[4]] for edge in live)
+                if count:
+                    counts[sid] = count
+
+    def count(self):
+        return self.counts[0].get(self.start, 0)
+
+    def results(self):
+        # (pkc, hdr) of each result, in key order
+        if not self.count(): return
+        stack = [iter(self.edges[0][self.start])]
+        path = []
+        while stack:
+            edge = next(stack[-1], None)
+            if edge is None:
+                stack.pop()
+                if path: path.pop()
+                continue
+            path.append(edge)
+            i = len(path)
+            if self.is_end(i, edge[4]):
+                yield self.result(path)
+            if i < len(self.edges):
+                stack.append(iter(self.edges[i][edge[4]]))
+            else:
+                stack.append(iter(()))
+
+    def result(self, path):
+        key_words, plain_words = [], []
+        key = plain = ""
+        for k, p, key_end, plain_end, _ in path:
+            key += k
+            plain += p
+            if key_end:
+                key_words.append(key)
+                key = ""
+            if plain_end:
+                plain_words.append(plain)
+                plain = ""
+        used = bisect_left(self.bounds, len(path))
+        remaining = self.fragments[used:]
+        pkc = Pkc(plaintext="".join(plain_words), key="".join(key_words), cipher=self.text[:self.bounds[used]],
+                  plain_words=plain_words, key_words=key_words, level=used, fragments=remaining)
+        hdr = f"{used} {'FINAL' if remaining else 'PERFECT'} product"
+        return pkc, hdr
+
+def product_search(cipher, fragments, md):
+    # The ProductSearch of cipher followed by fragments in order
+    bounds = [len(cipher)]
+    for fragment in fragments:
+        bounds.append(bounds[-1] + len(fragment))
+    return ProductSearch(cipher + "".join(fragments), bounds, list(fragments), md_automaton(md))
+
+def md_automaton(md):
+    return ProductAutomaton(md.words, md.keywords, md.min_keylen)
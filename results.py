@@ -0,0 +1,119 @@
+import argparse
+import json
+import re
+import sys
+from dataclasses import asdict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Streaming result files. Each result is one record: the Pkc fields
+# (plaintext, key, cipher, plain_words, key_words, level, fragments) plus
+# its header. jsonl files have one JSON object per line; msgpack files are
+# a stream of maps.
+
+FORMATS = ["jsonl", "msgpack"]
+BUFFER_SIZE = 1 << 20
+
+def require_msgpack():
+    if msgpack is None:
+        raise ImportError("msgpack is required for msgpack result files")
+
+def make_record(pkc, hdr):
+    record = asdict(pkc)
+    record['hdr'] = hdr.strip()
+    return record
+
+class ResultWriter:
+    def __init__(self, path, format, append=False):
+        if format not in FORMATS:
+            raise ValueError(f"'{format}' is not an allowed output format. Allowed formats are: {','.join(FORMATS)}")
+        if format == "msgpack":
+            require_msgpack()
+            self.packer = msgpack.Packer()
+        self.format = format
+        self.file = open(path, 'ab' if append else 'wb', buffering=BUFFER_SIZE)
+        self.count = 0
+
+    def write(self, pkc, hdr):
+        record = make_record(pkc, hdr)
+        if self.format == "jsonl":
+            self.file.write(json.dumps(record).encode() + b'\n')
+        else:
+            self.file.write(self.packer.pack(record))
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def format_of(path):
+    return "msgpack" if path.endswith(".msgpack") else "jsonl"
+
+def read_results(path, format=None):
+    # Yield the records in a result file, one at a time.
+    format = format or format_of(path)
+    with open(path, 'rb', buffering=BUFFER_SIZE) as f:
+        if format == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            require_msgpack()
+            yield from msgpack.Unpacker(f, raw=False)
+
+def filter_results(records, args):
+    perfect = re.compile(r'\bPERFECT\b')
+    plain_re = re.compile(args.plain) if args.plain else None
+    key_re = re.compile(args.key) if args.key else None
+    last_plain = None
+    for record in records:
+        if args.perfect and not perfect.search(record['hdr']):
+            continue
+        if args.min_level is not None and record['level'] < args.min_level:
+            continue
+        if plain_re and not plain_re.search(record['plaintext']):
+            continue
+        if key_re and not key_re.search(record['key']):
+            continue
+        if args.unique:
+            if record['plaintext'] == last_plain:
+                continue
+            last_plain = record['plaintext']
+        yield record
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream-filter nextgen result files")
+    parser.add_argument("files", nargs='+')
+    parser.add_argument("--format", choices=FORMATS) # default: from file extension
+    parser.add_argument("-f", "--field", default="plaintext") # field to print, or "json"
+    parser.add_argument("-p", "--plain", type=str) # plaintext regex
+    parser.add_argument("-k", "--key", type=str) # key regex
+    parser.add_argument("-l", "--min-level", type=int)
+    parser.add_argument("--perfect", action='store_true') # no remaining fragments
+    parser.add_argument("-u", "--unique", action='store_true') # skip repeated plaintext
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    out = sys.stdout
+    for path in args.files:
+        for record in filter_results(read_results(path, args.format), args):
+            if args.field == "json":
+                out.write(json.dumps(record) + '\n')
+            else:
+                value = record[args.field]
+                out.write((','.join(value) if isinstance(value, list) else str(value)) + '\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import heapq
+import json
+import math
+import os
+import re
+from wordcache import cache_path
+
+# Scoring of results by how much they look like English, for --top. The
+# model is built from a local corpus file of English text: log10
+# probabilities of each letter, of each letter after one letter (bigrams)
+# and after two letters (trigrams), with add-one smoothing, counted over
+# the corpus with the non-letters removed, since plaintexts have no spaces;
+# and the ranks of the corpus words by frequency. A word of rank r has the
+# Zipf probability 1 / (r * H), H the harmonic number of the ranked words;
+# words not in the corpus have the rank after the last. A dictionary is
+# sorted, not ranked, so a scorer of one has no word ranks: its texts are
+# scored by their letters alone.
+#
+# A text is scored by its log10 probability plus that of its words, per
+# letter, so texts of different lengths compare. The tables are cached as
+# json next to the compiled dictionaries, and rebuilt when the corpus
+# changes.
+
+VERSION = 1
+MAX_RANKED_WORDS = 100000
+LETTERS = 26
+
+def ngram_counts(path):
+    letters = [0] * LETTERS
+    bigrams = [0] * LETTERS ** 2
+    trigrams = [0] * LETTERS ** 3
+    words = {}
+    a, b = -1, -1
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            for word in re.findall('[a-z]+', line.lower()):
+                words[word] = words.get(word, 0) + 1
+                for c in word:
+                    c = ord(c) - 97
+                    letters[c] += 1
+                    if b >= 0:
+                        bigrams[b * LETTERS + c] += 1
+                        if a >= 0:
+                            trigrams[(a * LETTERS + b) * LETTERS + c] += 1
+                    a, b = b, c
+    ranked = sorted(words, key=lambda word: (-words[word], word))[:MAX_RANKED_WORDS]
+    return letters, bigrams, trigrams, ranked
+
+def log_probs(counts, contexts, size):
+    # log10 of (count + 1) / (count of its context + size), for each
+    # consecutive size counts of a context
+    return [math.log10((count + 1) / (contexts[i // size] + size)) for i, count in enumerate(counts)]
+
+class Scorer:
+    def __init__(self, letters, bigrams, trigrams, ranked=None):
+        total = sum(letters)
+        self.letters = [math.log10((count + 1) / (total + LETTERS)) for count in letters]
+        # the context of a bigram is its first letter, of a trigram its first two
+        self.bigrams = log_probs(bigrams, letters, LETTERS)
+        self.trigrams = log_probs(trigrams, bigrams, LETTERS)
+        self.ranks = None
+        if ranked is not None:
+            self.ranks = {word: rank for rank, word in enumerate(ranked, 1)}
+            harmonic = math.log(len(ranked) + 1) + 0.5772
+            self.unranked = len(ranked) + 1
+            self.log_harmonic = math.log10(harmonic)
+
+    def text_logprob(self, text):
+        # letters outside a-z, as in accented key words, are not scored and
+        # start a new n-gram context
+        logprob = 0.0
+        a, b = -1, -1
+        for c in text:
+            c = ord(c) - 97
+            if not 0 <= c < LETTERS:
+                a, b = -1, -1
+                continue
+            if b < 0:
+                logprob += self.letters[c]
+            elif a < 0:
+                logprob += self.bigrams[b * LETTERS + c]
+            else:
+                logprob += self.trigrams[(a * LETTERS + b) * LETTERS + c]
+            a, b = b, c
+        return logprob
+
+    def words_logprob(self, words):
+        if not words or self.ranks is None: return 0.0
+        return -sum(math.log10(self.ranks.get(word, self.unranked)) + self.log_harmonic for word in words)
+
+    def score(self, plaintext, key="", plain_words=None, key_words=None):
+        letters = len(plaintext) + len(key)
+        if not letters: return 0.0
+        logprob = self.text_logprob(plaintext) + self.text_logprob(key) + \
+            self.words_logprob(plain_words) + self.words_logprob(key_words)
+        return logprob / letters
+
+    def score_pkc(self, pkc):
+        return self.score(pkc.plaintext, pkc.key, pkc.plain_words, pkc.key_words)
+
+def load_scorer(path, word_ranks=True):
+    # The Scorer of the corpus at path, from its cached tables if they are
+    # up to date; without word ranks if not word_ranks, for a dictionary.
+    stat = os.stat(path)
+    source = [VERSION, stat.st_mtime_ns, stat.st_size]
+    tables_path = cache_path(path, "ngram", 0, ext="json")
+    try:
+        with open(tables_path) as f:
+            tables = json.load(f)
+        if tables['source'] == source:
+            return Scorer(tables['letters'], tables['bigrams'], tables['trigrams'],
+                          tables['ranked'] if word_ranks else None)
+    except (OSError, ValueError, KeyError):
+        pass
+    letters, bigrams, trigrams, ranked = ngram_counts(path)
+    try:
+        os.makedirs(os.path.dirname(tables_path), exist_ok=True)
+        tmp_path = f"{tables_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': source, 'letters': letters, 'bigrams': bigrams,
+                       'trigrams': trigrams, 'ranked': ranked}, f)
+        os.replace(tmp_path, tables_path)
+    except OSError:
+        pass # no cache, e.g. read-only home directory
+    return Scorer(letters, bigrams, trigrams, ranked if word_ranks else None)
+
+class TopK:
+    """
+    The k highest scored items pushed, in a min-heap of (score, -seq, item):
+    of items with equal scores, the ones pushed first are kept. An item
+    pushed with the key of an item kept replaces it if it scores higher,
+    and is dropped otherwise.
+    """
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.keys = {} # -seq -> key of the items kept
+        self.kept = {} # key -> score of the item kept
+        self.seq = 0
+
+    def push(self, score, item, key=None):
+        if key is not None and key in self.kept:
+            if score <= self.kept[key]:
+                return
+            old = next(entry for entry in self.heap if self.keys.get(entry[1]) == key)
+            self.heap.remove(old)
+            heapq.heapify(self.heap)
+            del self.keys[old[1]]
+        entry = (score, -self.seq, item)
+        self.seq += 1
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            dropped = heapq.heapreplace(self.heap, entry)
+            self.kept.pop(self.keys.pop(dropped[1], None), None)
+        else:
+            return
+        if key is not None:
+            self.keys[entry[1]] = key
+            self.kept[key] = score
+
+    def __len__(self):
+        return len(self.heap)
+
+    def results(self):
+        # (score, item), highest score first
+        return [(score, item) for score, _, item in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
@@ -0,0 +1,103 @@
+import json
+import time
+from collections import Counter
+
+# Search instrumentation. Functions and generators are wrapped only when
+# stats are enabled, so there is no cost otherwise. Times are wall time
+# spent inside the function, or inside the generator's next()/send().
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = Counter()          # op -> nodes expanded
+        self.level_nodes = Counter()    # level -> nodes expanded
+        self.level_children = Counter() # level -> child nodes expanded
+        self.calls = Counter()          # function or generator -> calls
+        self.items = Counter()          # generator -> items generated
+        self.prunes = Counter()         # generator -> valid=False sent back
+        self.times = Counter()          # function or generator -> seconds
+
+    def clear(self):
+        self.__init__()
+
+    def merge(self, other):
+        for name in vars(self):
+            getattr(self, name).update(getattr(other, name))
+
+    def counted_op(self, generate_op):
+        def wrapper(op, ctx, md):
+            # ctx.level is the level of the node
+            self.nodes[op.name] += 1
+            self.level_children[ctx.level - 1] += 1
+            self.level_nodes[ctx.level] += 1
+            return generate_op(op, ctx, md)
+        return wrapper
+
+    def timed_function(self, name, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[name] += time.perf_counter() - start
+                self.calls[name] += 1
+        return wrapper
+
+    def timed_generator(self, name, func):
+        def wrapper(*args, **kwargs):
+            self.calls[name] += 1
+            generator = func(*args, **kwargs)
+            value = None
+            while True:
+                if value is False:
+                    self.prunes[name] += 1
+                start = time.perf_counter()
+                try:
+                    item = generator.send(value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    self.times[name] += time.perf_counter() - start
+                self.items[name] += 1
+                value = yield item
+        return wrapper
+
+    def report(self, op_generators):
+        ops = {}
+        for op, name in op_generators.items():
+            ops[op] = {
+                'nodes': self.nodes[op],
+                'children': self.items[name],
+                'prunes': self.prunes[name],
+                'generator': name,
+                'calls': self.calls[name],
+                'seconds': round(self.times[name], 6)
+            }
+        levels = {}
+        for level in sorted(self.level_nodes):
+            nodes = self.level_nodes[level]
+            levels[level] = {
+                'nodes': nodes,
+                'children': self.level_children[level],
+                'branching': round(self.level_children[level] / nodes, 3)
+            }
+        functions = {name: {'calls': self.calls[name], 'seconds': round(self.times[name], 6)}
+                     for name in self.times if name not in op_generators.values()}
+        return {'ops': ops, 'levels': levels, 'functions': functions}
+
+    def print_table(self, op_generators):
+        report = self.report(op_generators)
+        print(f"\n{'op':<22}{'nodes':>10}{'children':>10}{'prunes':>10}  {'generator':<32}{'seconds':>10}")
+        for op, row in report['ops'].items():
+            print(f"{op:<22}{row['nodes']:>10}{row['children']:>10}{row['prunes']:>10}  " \
+                  f"{row['generator']:<32}{row['seconds']:>10.3f}")
+        print(f"\n{'level':<8}{'nodes':>10}{'children':>10}{'branching':>10}")
+        for level, row in report['levels'].items():
+            print(f"{level:<8}{row['nodes']:>10}{row['children']:>10}{row['branching']:>10.2f}")
+        print(f"\n{'function':<32}{'calls':>10}{'seconds':>10}")
+        for name, row in report['functions'].items():
+            print(f"{name:<32}{row['calls']:>10}{row['seconds']:>10.3f}")
+
+    def print_json(self, op_generators):
+        print(json.dumps(self.report(op_generators)))
+
+search_stats = SearchStats()
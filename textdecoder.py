@@ -1,110 +1,202 @@
+import argparse
+import difflib
+import subprocess
+from bisect import bisect_left
+from codec import decode_with_key
+from wordcache import load_compiled
+from wordgen import make_words
+from product import ProductAutomaton
+from orderings import FragmentGraph
+
+# Python port of the perms.cpp decoder. For each order of the fragments,
+# every key that is a sequence of words is tried on the cipher, and the
+# plaintext it decodes must be a sequence of words of min to max letters,
+# at most max_trigrams of them 3 letters long.
+#
+# The key is built a word at a time and checked after each word: the
+# plaintext decoded so far must be words followed by a partial word that
+# is shorter than max_word_length and starts some word, which is found by
+# bisecting the words of its first letter. The plaintext is followed as
+# the set of its segmentation states (offset of the partial word, number
+# of trigrams before it), so each key word only decodes and checks its own
+# letters. Key words of a first letter that decodes to no possible
+# plaintext letter are skipped as one range of the sorted words.
+#
+# Words are read as perms.cpp does: alphabetic words of 3 or more letters
+# with a vowel, and SMALL_WORDS.
+
+MAX_WORD_LENGTH = 10
+MAX_TRIGRAMS = 4
+SMALL_WORDS = ["a", "in", "on", "of", "by", "to", "up", "at", "or", "it",
+               "an", "no", "do", "be", "go", "is", "as"]
+FRAGMENTS = ['qvu', 'bma', 'aps', 'e', 'tn', 'sc', 'nc', 'xzfdq', 'ngqzp']
+
+def read_perms_wordlist(path, min_word_length=0):
+    # min_word_length is for load_compiled: plaintext word lengths are
+    # checked by TextDecoder, key words have none
+    wordlist = set(SMALL_WORDS)
+    with open(path, 'r') as f:
+        for word in f:
+            stripped = word.strip()
+            if stripped.isalpha() and len(stripped) >= 3 \
+                    and any(c in "aeiouy" for c in stripped):
+                wordlist.add(stripped.lower())
+    return sorted(wordlist)
+
 class TextDecoder:
-    def __init__(self, fragments, wordlist_path, min_word_length=1):
+    def __init__(self, fragments, wordlist_path, min_word_length=1,
+                 max_word_length=MAX_WORD_LENGTH, max_trigrams=MAX_TRIGRAMS):
         self.fragments = fragments
         self.target_length = sum(len(f) for f in fragments)
         self.min_word_length = min_word_length
-        #self.wordlist = load_wordlist(wordlist_path)
-
-    def create_key_generator(self, target_length):
-        def generate_combinations(current_words=None, current_length=0):
-            if current_words is None:
-                current_words = []
-                
-            if current_length == target_length:
-                yield current_words
-                return
-                
-            if current_length > target_length:
+        self.max_word_length = max_word_length
+        self.max_trigrams = max_trigrams
+        compiled = load_compiled(wordlist_path, "perms", 0, read_perms_wordlist)
+        self.wordlist = compiled.words
+        self.letter_starts = compiled.letter_starts
+        self.word_set = set(self.wordlist)
+        # plaintext words are limited in length, key words are not
+        plain_words = make_words([word for word in self.wordlist
+                                  if min_word_length <= len(word) <= max_word_length])
+        self.automaton = ProductAutomaton(plain_words, make_words(self.wordlist), 0)
+
+    def is_plain_word(self, word, trigrams):
+        return self.min_word_length <= len(word) <= self.max_word_length and \
+            word in self.word_set and (len(word) != 3 or trigrams < self.max_trigrams)
+
+    def starts_word(self, text):
+        # True if text is a proper prefix of a word
+        lo, hi = self.letter_starts[ord(text[0]) - 97], self.letter_starts[ord(text[0]) - 96]
+        idx = bisect_left(self.wordlist, text, lo, hi)
+        if idx < hi and self.wordlist[idx] == text:
+            idx += 1
+        return idx < hi and self.wordlist[idx].startswith(text)
+
+    def advance(self, states, plain, start):
+        # The segmentation states of plain from those of plain[:start]. A
+        # state is (offset of the partial word, trigrams before it).
+        for end in range(start + 1, len(plain) + 1):
+            next_states = set(states)
+            for offset, trigrams in states:
+                word = plain[offset:end]
+                if self.is_plain_word(word, trigrams):
+                    next_states.add((end, trigrams + (len(word) == 3)))
+            states = next_states
+        # bail on partial words that are too long or start no word
+        return {(offset, trigrams) for offset, trigrams in states
+                if offset == len(plain) or
+                len(plain) - offset < self.max_word_length and self.starts_word(plain[offset:])}
+
+    def generate_keys(self, encoded):
+        # (key words, plaintext) of each key that decodes encoded to words
+        key_words = []
+
+        def generate(plain, states):
+            length = len(plain)
+            if length == len(encoded):
+                if any(offset == length for offset, _ in states):
+                    yield list(key_words), plain
                 return
-                
-            remaining_length = target_length - current_length
-            if remaining_length < self.min_word_length:
+            remaining = len(encoded) - length
+            if remaining < self.min_word_length:
                 return
-                
-            for word in self.wordlist:
-                if len(word) <= remaining_length:
-                    yield from generate_combinations(
-                        current_words + [word],
-                        current_length + len(word)
-                    )
-                    
-        return generate_combinations()
-
-    def process_fragment_permutation(self, fragment_perm, key_gen):
+            for letter in range(26):
+                lo, hi = self.letter_starts[letter], self.letter_starts[letter + 1]
+                if lo == hi: continue
+                first = decode_with_key(encoded[length], chr(letter + 97))
+                if not self.advance(states, plain + first, length):
+                    continue
+                for word in self.wordlist[lo:hi]:
+                    if len(word) > remaining: continue
+                    next_plain = plain + decode_with_key(encoded[length:length + len(word)], word)
+                    next_states = self.advance(states, next_plain, length)
+                    if next_states:
+                        key_words.append(word)
+                        yield from generate(next_plain, next_states)
+                        key_words.pop()
+
+        yield from generate("", {(0, 0)})
+
+    def process_fragment_permutation(self, fragment_perm):
         encoded_text = ''.join(fragment_perm)
-        
-        num_keys = 0
-        for key_words in key_gen:
-            key = ''.join(key_words)
-            num_keys += 1
-
-            if num_keys % 100 == 0:
-                print(f"\r keys: {num_keys}", end="", flush=True)
-
-            decoded = self.decode_with_key(encoded_text, key)
-            if decoded:
-                valid_words = self.verify_decoded_text(decoded)
-                if valid_words:
-                    yield (fragment_perm, key_words, decoded, valid_words)
-
-    def beaufort_decrypt(self, ciphertext, key):
-        plaintext = ""
-        key_length = len(key)
-        key_as_int = [ord(i) - ord('a') for i in key]
-        ciphertext_int = [ord(i) - ord('a') for i in ciphertext]
-        
-        for i in range(len(ciphertext_int)):
-            plain = (key_as_int[i % key_length] - ciphertext_int[i]) % 26
-            plaintext += chr(plain + ord('a'))
-    
-        return plaintext
-
-    def decode_with_key(self, encoded_text, key):
-        return self.beaufort_decrypt(encoded_text, key)
+        for key_words, decoded in self.generate_keys(encoded_text):
+            valid_words = self.verify_decoded_text(decoded)
+            if valid_words:
+                yield (fragment_perm, key_words, decoded, valid_words)
 
     def verify_decoded_text(self, text):
+        # every segmentation of text into plaintext words
         if len(text) != self.target_length:
             return []
-            
-        def find_exact_matches(remaining_text, current_words=None):
-            if current_words is None:
-                current_words = []
-                
-            if not remaining_text:
-                return [current_words]
-                
-            if len(remaining_text) < self.min_word_length:
-                return []
-                
-            results = []
-            for word in self.wordlist:
-                if remaining_text.startswith(word):
-                    new_results = find_exact_matches(
-                        remaining_text[len(word):],
-                        current_words + [word]
-                    )
-                    results.extend(new_results)
-                    
-            return results
-            
-        return find_exact_matches(text.lower())
+
+        def find_exact_matches(offset, trigrams, current_words):
+            if offset == len(text):
+                yield list(current_words)
+                return
+            for end in range(offset + self.min_word_length,
+                             min(offset + self.max_word_length, len(text)) + 1):
+                word = text[offset:end]
+                if self.is_plain_word(word, trigrams):
+                    current_words.append(word)
+                    yield from find_exact_matches(end, trigrams + (len(word) == 3), current_words)
+                    current_words.pop()
+
+        return list(find_exact_matches(0, 0, []))
 
     def process_all(self):
-        for frag_perm in permutations(self.fragments):
-            print(f"frags: {''.join(frag_perm)}")
-            key_gen = self.create_key_generator(self.target_length)
-            yield from self.process_fragment_permutation(frag_perm, key_gen)
+        # only the fragment orders that key and plaintext words can cover
+        for frag_perm in FragmentGraph(self.fragments, self.automaton).orders():
+            yield from self.process_fragment_permutation(frag_perm)
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--dict", default="./words")
+    parser.add_argument("-f", "--fragments", type=str)
+    parser.add_argument("-m", "--min-word-length", type=int, default=1)
+    parser.add_argument("--mx", type=int, default=MAX_WORD_LENGTH) # max-word-length
+    parser.add_argument("-t", "--trigrams", type=int, default=MAX_TRIGRAMS) # max 3 letter plaintext words
+    parser.add_argument("--perms", type=str) # perms binary to compare output with
+    return parser.parse_args()
 
+def output_lines(decoder):
+    # the lines perms.cpp prints for the results, with the first segmentation
+    encoded = None
+    for frag_perm, key_words, decoded, valid_words in decoder.process_all():
+        if ''.join(frag_perm) != encoded:
+            encoded = ''.join(frag_perm)
+            yield f"Encoded: {encoded}"
+        yield f"Decoded: {decoded}: {' '.join(valid_words[0])} "
+        yield f"   keys: {' '.join(key_words)} "
 
 """
-decoder = TextDecoder(fragments, args.dict, min_word_length=3)
+perms: 37 lines, identical
+"""
+def test_perms(perms_path, args, fragments, decoder):
+    # perms.cpp's output against TextDecoder's for the same options, on one
+    # thread so its results come in order; use a small --dict, e.g.
+    #   g++ -std=c++20 -O2 -pthread -o perms perms.cpp
+    #   python textdecoder.py -d <small dict> -f d,v,wlg,legn,lca --perms ./perms
+    command = [perms_path, "-d", args.dict, "-f", ','.join(fragments), "-m", str(args.min_word_length),
+               "--mx", str(args.mx), "-t", str(args.trigrams), "-j", "1"]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    expected = [line for line in output.splitlines() if not line.startswith("perms: ")]
+    lines = list(output_lines(decoder))
+    if lines == expected:
+        print(f"perms: {len(lines)} lines, identical")
+        return
+    print(f"perms: {len(expected)} lines, textdecoder: {len(lines)} lines, differ")
+    for line in difflib.unified_diff(expected, lines, "perms", "textdecoder", lineterm=""):
+        print(line)
 
-for frag_perm, key_words, decoded, valid_words in decoder.process_all():
-    print(f"\nFragment permutation: {' '.join(frag_perm)}")
-    print(f"Key words: {' '.join(key_words)}")
-    print(f"Decoded text: {decoded}")
-    print("Valid word combinations:")
-    for words in valid_words:
-        print(f"  {' '.join(words)}")
+def main():
+    args = parse_args()
+    fragments = args.fragments.split(',') if args.fragments else FRAGMENTS
+    decoder = TextDecoder(fragments, args.dict, args.min_word_length, args.mx, args.trigrams)
+    if args.perms:
+        test_perms(args.perms, args, fragments, decoder)
+        return
+    for line in output_lines(decoder):
+        print(line)
 
-"""
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# A node is a dict of child letter -> node. A node that terminates a word
+# also contains the END key. Built from a sorted wordlist, the children of
+# every node are kept in sorted order (END sorts first), so walking the
+# trie visits words in the same order as the sorted list.
+END = ''
+
+class Trie:
+    def __init__(self, wordlist=()):
+        self.root = {}
+        self.max_len = 0 # length of the longest word
+        for word in sorted(wordlist):
+            self.add(word)
+
+    def add(self, word):
+        node = self.root
+        for c in word:
+            child = node.get(c)
+            if child is None:
+                child = node[c] = {}
+            node = child
+        node[END] = True
+        self.max_len = max(self.max_len, len(word))
+
+    def find(self, prefix, node=None):
+        # Return the node for prefix, or None if no word starts with prefix.
+        if node is None:
+            node = self.root
+        for c in prefix:
+            node = node.get(c)
+            if node is None:
+                return None
+        return node
+
+    def is_word(self, text):
+        node = self.find(text)
+        return node is not None and END in node
+
+    def is_prefix(self, prefix):
+        # True if prefix is a proper prefix of some word.
+        node = self.find(prefix)
+        return node is not None and is_prefix_node(node)
+
+    def completions(self, prefix, proper=False):
+        # Yield words starting with prefix in sorted order. If proper,
+        # prefix itself is not yielded.
+        node = self.find(prefix)
+        if node is None:
+            return
+        stack = [(prefix, node)]
+        while stack:
+            text, node = stack.pop()
+            if END in node and not (proper and len(text) == len(prefix)):
+                yield text
+            for c in reversed(node):
+                if c != END:
+                    stack.append((text + c, node[c]))
+
+    def last(self, prefix):
+        # Return the last word, in sorted order, that starts with prefix.
+        node = self.find(prefix)
+        if node is None:
+            return None
+        word = prefix
+        while True:
+            c = next(reversed(node))
+            if c == END:
+                return word
+            word += c
+            node = node[c]
+
+
+def is_prefix_node(node):
+    return len(node) > (END in node)
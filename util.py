@@ -1,4 +1,5 @@
 import argparse
+from wordcache import load_compiled
 
 def safe_len(o):
     return 0 if o is None else len(o)
@@ -9,6 +10,10 @@ def aggregate_len(c):
 
 
 def load_wordlist(path, min_word_length):
+    return load_compiled(path, "alpha", min_word_length, read_wordlist).words
+
+
+def read_wordlist(path, min_word_length):
     wordlist = []
     with open(path, 'r') as f:
         for word in f:
@@ -36,6 +41,18 @@ def parse_args():
     parser.add_argument("--pp", type=str) # plain-prefix
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-w', '--show-words', action='store_true')
+    parser.add_argument("--tw", type=int) # top-words: keep about this many --show-words entries
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", choices=["jsonl", "msgpack"]) # result file format
+    parser.add_argument("--of", type=str) # output-file, default results.<format>
+    parser.add_argument("--stats", nargs="?", const="table", choices=["table", "json"])
+    parser.add_argument("--checkpoint", type=str) # checkpoint file for find --cipher
+    parser.add_argument("--ci", type=float, default=60) # checkpoint-interval, seconds
+    parser.add_argument("--resume", type=str) # checkpoint file to resume from
+    parser.add_argument("--top", type=int) # keep the top scored results
+    parser.add_argument("--corpus", type=str) # English text to score with, default --dict without word ranks
+    parser.add_argument("--bf", action='store_true') # best-first: expand the best scored branches first, in one process
+    parser.add_argument("--fixed", action='store_true') # search --cipher then the fragments in their given order, with the product automaton
     return parser.parse_args()
 
 
@@ -0,0 +1,94 @@
+import hashlib
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+# Compiled dictionary cache. A dictionary file filtered one way (kind) with
+# a given min_word_length is compiled once to:
+#   header        magic, version, source mtime_ns, source size,
+#                 min_word_length, number of words, size of words blob
+#   letter_starts 27 uint32: index of the first word starting with each of
+#                 'a'..'z', then the index after the last 'z' word
+#   words         sorted words, utf-8, '\n' separated
+# and is loaded with mmap. It is rebuilt when the source file changes.
+
+CompiledDict = namedtuple('CompiledDict', ['words', 'letter_starts'])
+
+MAGIC = b'PADICT'
+VERSION = 2
+HEADER = struct.Struct('<6sHqqIII')
+
+def cache_dir():
+    return os.environ.get('POLYALPHA_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'polyalpha'))
+
+def cache_path(path, kind, min_word_length, ext="dict"):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), f"{digest}-{kind}-{min_word_length}.{ext}")
+
+def letter_starts(words):
+    starts = []
+    idx = 0
+    for letter in "abcdefghijklmnopqrstuvwxyz":
+        while idx < len(words) and words[idx][:1] < letter:
+            idx += 1
+        starts.append(idx)
+    while idx < len(words) and words[idx][:1] <= 'z':
+        idx += 1
+    starts.append(idx)
+    return starts
+
+def write_compiled(path, stat, min_word_length, words):
+    blob = '\n'.join(words).encode('utf-8')
+    starts = struct.pack('<27I', *letter_starts(words))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, stat.st_mtime_ns, stat.st_size,
+                            min_word_length, len(words), len(blob)))
+        f.write(starts)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+def read_compiled(path, stat, min_word_length):
+    # Returns None if there is no valid compiled file for this source.
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mm) < HEADER.size:
+        return None
+    magic, version, mtime_ns, size, min_len, num_words, blob_len = HEADER.unpack_from(mm)
+    if (magic, version, mtime_ns, size, min_len) != \
+            (MAGIC, VERSION, stat.st_mtime_ns, stat.st_size, min_word_length):
+        return None
+    # a truncated file is too short to cast
+    if len(mm) != HEADER.size + 27 * 4 + blob_len:
+        return None
+    pos = HEADER.size
+    starts = memoryview(mm)[pos:pos + 27 * 4].cast('I')
+    pos += 27 * 4
+    words = mm[pos:pos + blob_len].decode('utf-8').split('\n') if num_words else []
+    return CompiledDict(words=words, letter_starts=starts)
+
+def load_compiled(path, kind, min_word_length, read_words):
+    """
+    Load the dictionary at path, filtered by read_words(path, min_word_length),
+    from its compiled cache file, compiling it first if needed. read_words
+    must return a sorted list; kind names the filter it applies.
+    """
+    stat = os.stat(path)
+    compiled_path = cache_path(path, kind, min_word_length)
+    compiled = read_compiled(compiled_path, stat, min_word_length)
+    if compiled is None:
+        words = read_words(path, min_word_length)
+        try:
+            write_compiled(compiled_path, stat, min_word_length, words)
+        except OSError:
+            pass # no cache, e.g. read-only home directory
+        compiled = read_compiled(compiled_path, stat, min_word_length)
+        if compiled is None:
+            compiled = CompiledDict(words=words, letter_starts=letter_starts(words))
+    return compiled
@@ -1,12 +1,133 @@
-from collections import namedtuple
-from codec import decode_with_key
+from array import array
+from bisect import bisect_left
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+from heapq import merge
+from itertools import islice
+from codec import beaufort_decrypt, decode_with_key, decode_keys, is_letters, to_matrix, to_texts, np, native
 from util import join, safe_len
 from context import Pkc, Context
+from trie import Trie, END, is_prefix_node
 
-Words = namedtuple('Words', ['set', 'list'])
+# index maps first letter -> word length -> sorted words
+Words = namedtuple('Words', ['set', 'list', 'trie', 'index'])
 
-#all_plain_words = set()
-#all_key_words = set()
+FEASIBLE_CACHE_SIZE = 1 << 16
+
+# Key word candidates by cipher window and segmentation state: the indices,
+# into keywords.list, of the key words that decode the window to a feasible
+# plaintext. Evicted least recently used first, to keep at most
+# MAX_CANDIDATE_INDICES indices.
+key_candidates = OrderedDict()
+key_candidate_stats = {'hits': 0, 'misses': 0, 'indices': 0}
+MAX_CANDIDATE_INDICES = 1 << 24
+# window decodes of each first letter's key words, and the padded key
+# matrices they are decoded with, each evicted least recently used first
+decoded_ranges = OrderedDict()
+letter_matrices = OrderedDict()
+DECODE_CACHE_SIZE = 1 << 12
+# native.Trie of each trie, None for tries of words that are not all a-z
+native_tries = {}
+
+def make_words(wordlist):
+    return Words(set=set(wordlist), list=wordlist, trie=Trie(wordlist), index=make_index(wordlist))
+
+def make_index(wordlist):
+    index = {}
+    for word in sorted(wordlist):
+        index.setdefault(word[0], {}).setdefault(len(word), []).append(word)
+    return index
+
+def indexed_words(words, letters, min_len, max_len, start_word=None):
+    # Words starting with one of letters (in sorted order) whose length is
+    # in [min_len, max_len], in sorted order, from start_word on
+    for letter in letters:
+        if max_len >= words.trie.max_len:
+            # no upper bound: the letter's range of the sorted list is
+            # faster than merging its length buckets
+            lo = bisect_left(words.list, max(letter, start_word or letter))
+            hi = bisect_left(words.list, chr(ord(letter) + 1))
+            yield from (word for word in islice(words.list, lo, hi) if len(word) >= min_len)
+            continue
+        buckets = []
+        for length, bucket in words.index[letter].items():
+            if min_len <= length <= max_len:
+                buckets.append(bucket[bisect_left(bucket, start_word):] if start_word else bucket)
+        yield from merge(*buckets)
+
+def letter_range(words, letter):
+    return bisect_left(words.list, letter), bisect_left(words.list, chr(ord(letter) + 1))
+
+def decode_letter_range(words, window, letter):
+    # window decoded with each key word starting with letter, each cut to
+    # its key word's length, using the letter's padded uint8 key matrix
+    key = (words.trie, window, letter)
+    texts = decoded_ranges.get(key)
+    if texts is not None:
+        decoded_ranges.move_to_end(key)
+        return texts
+    lo, hi = letter_range(words, letter)
+    if (words.trie, letter) in letter_matrices:
+        letter_matrices.move_to_end((words.trie, letter))
+    else:
+        letters = np is not None and all(map(is_letters, words.list[lo:hi]))
+        letter_matrices[(words.trie, letter)] = \
+            to_matrix(words.list[lo:hi], max(map(len, words.list[lo:hi]), default=0)) if letters else None
+        if len(letter_matrices) > DECODE_CACHE_SIZE:
+            letter_matrices.popitem(last=False)
+    matrix = letter_matrices[(words.trie, letter)]
+    if matrix is None:
+        # no numpy, or words that don't fit a uint8 letter matrix
+        texts = [decode_with_key(window[:len(word)], word) for word in words.list[lo:hi]]
+    else:
+        texts = [text[:len(word)] for text, word in zip(to_texts(decode_keys(window, matrix)), words.list[lo:hi])]
+    decoded_ranges[key] = texts
+    if len(decoded_ranges) > DECODE_CACHE_SIZE:
+        decoded_ranges.popitem(last=False)
+    return texts
+
+def key_word_candidates(md, cipher, key_len, segments, max_len, start_idx=0):
+    # Yield the indices, from start_idx on, of the key words of length
+    # min_keylen to max_len that decode cipher at key_len to a feasible
+    # plaintext from segments. Only complete lists are cached, so a search
+    # that stops early costs no more than checking the words it used.
+    keywords = md.keywords
+    trie = md.words.trie
+    window = cipher[key_len:key_len + keywords.trie.max_len]
+    state = (keywords.trie, trie, window, max_len, md.min_keylen, frozenset(map(id, segments)))
+    cached = key_candidates.get(state)
+    if cached is not None:
+        key_candidate_stats['hits'] += 1
+        key_candidates.move_to_end(state)
+        yield from islice(cached, bisect_left(cached, start_idx), None)
+        return
+    key_candidate_stats['misses'] += 1
+
+    indices = array('I')
+    for letter in keywords.index:
+        lo, hi = letter_range(keywords, letter)
+        if hi <= start_idx or \
+                not is_feasible(advance_segments(segments, decode_with_key(window[0], letter), trie)):
+            continue
+        for idx, plain in enumerate(decode_letter_range(keywords, window, letter), lo):
+            if md.min_keylen <= len(keywords.list[idx]) <= max_len and \
+                    is_feasible(advance_segments(segments, plain, trie)):
+                indices.append(idx)
+                if idx >= start_idx:
+                    yield idx
+
+    if start_idx == 0:
+        key_candidates[state] = indices
+        key_candidate_stats['indices'] += len(indices)
+        while key_candidate_stats['indices'] > MAX_CANDIDATE_INDICES:
+            _, evicted = key_candidates.popitem(last=False)
+            key_candidate_stats['indices'] -= len(evicted)
+
+def print_key_candidate_stats():
+    lookups = key_candidate_stats['hits'] + key_candidate_stats['misses']
+    hit_rate = 100 * key_candidate_stats['hits'] / lookups if lookups else 0
+    print(f"key candidates: {len(key_candidates)}, hits: {key_candidate_stats['hits']}, " \
+          f"misses: {key_candidate_stats['misses']}, hit rate: {hit_rate:.1f}%")
 
 def get_prefix_start_idx(prefix, wordlist):
     # Find first potential match using binary search
@@ -19,69 +140,81 @@ def get_prefix_start_idx(prefix, wordlist):
             right = mid - 1
     return left
 
+def first_key_word_candidates(ctx, md):
+    # None if the first key word can be any key word
+    if ctx.first_key_words is not None:
+        return ctx.first_key_words
+    # Only filter first keyword on key_pfx
+    if ctx.key_pfx:
+        return md.keywords.trie.completions(ctx.key_pfx)
+    return None
+
 def generate_key_words(ctx, md):
     ctx_key_words = ctx.key_words or []
     existing_key = join(ctx_key_words)
 
-    def backtrack(key_words, start_idx):
+    def print_state(result, key_words):
+        key = existing_key + join(key_words)
+        plain = (ctx.plain_pfx or "") + decode_with_key(ctx.cipher[:len(key)], key)
+        print(f"gen_kw: {result} p: {plain}, k: {key}, c: {ctx.cipher}")
+
+    # key words longer than the remaining cipher are only useful if there
+    # are fragments to extend the cipher with
+    def max_word_len(key_len):
+        return md.keywords.trie.max_len if ctx.fragments else len(ctx.cipher) - key_len
+
+    def candidate_words(key_words, key_len, segments):
+        candidates = None if key_words else first_key_word_candidates(ctx, md)
+        if candidates is not None:
+            return candidates
+        if key_len >= len(ctx.cipher):
+            return indexed_words(md.keywords, md.keywords.index, md.min_keylen, max_word_len(key_len))
+        # the key words that keep the plaintext feasible, in sorted order;
+        # later key words start from key_pfx
+        start_idx = bisect_left(md.keywords.list, ctx.key_pfx) if key_words and ctx.key_pfx else 0
+        return (md.keywords.list[idx] for idx in
+                key_word_candidates(md, ctx.cipher, key_len, segments, max_word_len(key_len), start_idx))
+
+    # segments is the segmentation state of the plaintext decoded so far, so
+    # each added key word only decodes and checks the characters it covers
+    def backtrack(key_words, key_len, segments):
         if key_words:
-            key = existing_key + join(key_words)
-            plain = decode_with_key(ctx.cipher[:len(key)], key)
-            if ctx.plain_pfx:
-                plain = ctx.plain_pfx + plain
-            if not contains_words_and_word_prefix(plain, md.words):
-                if md.verbose: print(f"gen_kw: Bad p: {plain}, k: {key}, c: {ctx.cipher}")
+            if not is_feasible(segments):
+                if md.verbose: print_state("Bad", key_words)
                 return
-            if md.verbose: print(f"gen_kw: Good p: {plain}, k: {key}, c: {ctx.cipher}")
-            if len(key) >= len(ctx.cipher):
-                #if (ctx.level == 1): print(f" gen_kw p: {plain}, kw: {key_words}")
+            if md.verbose: print_state("Good", key_words)
+            if key_len >= len(ctx.cipher):
                 yield ctx_key_words + key_words
                 return
 
         # Try adding one more word to the key
-        for i in range(start_idx, len(md.keywords.list)):
-            word = md.keywords.list[i]
+        for word in candidate_words(key_words, key_len, segments):
             if len(word) < md.min_keylen: continue
-            # Only filter first keyword on key_pfx
-            if not key_words and ctx.key_pfx and not word.startswith(ctx.key_pfx):
-                return
+            end_idx = key_len + len(word)
+            plain = decode_with_key(ctx.cipher[key_len:end_idx], word)
             key_words.append(word)
-            yield from backtrack(key_words, start_idx)  # Allow repetition of words
+            # Allow repetition of words
+            yield from backtrack(key_words, end_idx, advance_segments(segments, plain, trie))
             key_words.pop()
 
     # Start backtracking with empty key
-    start_idx = 0
-    if ctx.key_pfx:
-        start_idx = get_prefix_start_idx(ctx.key_pfx, md.keywords.list)
-    yield from backtrack([], start_idx)
-
+    trie = md.words.trie
+    plain = (ctx.plain_pfx or "") + decode_with_key(ctx.cipher[:len(existing_key)], existing_key)
+    segments = advance_segments([trie.root], plain, trie)
+    yield from backtrack([], len(existing_key), segments)
 
-def generate_words_with_prefix(word_list, prefix, key_len=0):
-    left, right = 0, len(word_list) - 1
-    
-    while left <= right:
-        mid = (left + right) // 2
-        if word_list[mid] < prefix:
-            left = mid + 1
-        else:
-            right = mid - 1
 
+def generate_words_with_prefix(words, prefix, key_len=0):
     N = 2
     prev_stub = None
-    start_idx = left
-    end_idx = len(word_list)
     valid_stub = True
-    for i in range(start_idx, end_idx):
-        word = word_list[i]
-        if len(word) <= len(prefix):
-            continue
-        if not word.startswith(prefix):
-            break
+    for word in words.trie.completions(prefix, proper=True):
         if key_len < N:
             stub = word[:N]
             if stub != prev_stub:
                 prev_stub = stub
-                if (i + 1 < end_idx) and (word_list[i + 1][:N] == stub):
+                # more than one word starts with stub
+                if len(stub) == N and word != words.trie.last(stub):
                     valid_stub = yield stub, True
                     if valid_stub:
                         print(f"Found valid word starting with '{stub}'")
@@ -105,74 +238,60 @@ def generate_words(ctx, words):
               - complete_words is a list of words from the wordlist or None if empty
               - prefix is either a string (prefix of a word in wordlist) or None
     """
-    # Use binary search approach to check if a string is a prefix
-    def is_prefix_of_word(prefix):
-        left, right = 0, len(words.list) - 1
-        while left <= right:
-            mid = (left + right) // 2
-            if words.list[mid] < prefix:
-                left = mid + 1
-            else:
-                right = mid - 1
-        
-        for i in range(left, len(words.list)):
-            word = words.list[i]
-            if not word.startswith(prefix):
+    # Segmentation DP. edges[i] are the end positions of the words starting
+    # at position i, open[i] is whether plaintext[i:] is a word prefix, and
+    # reach[i] is whether position i can reach the end. Only reachable
+    # edges are enumerated, so every path yields and each partition is
+    # yielded once. Partitions only end with complete words when there is no
+    # plain_pfx.
+    trie = words.trie
+    text = ctx.plaintext
+    n = len(text)
+    complete = not ctx.plain_pfx
+    edges = [[] for _ in range(n + 1)]
+    open_ = [False] * (n + 1)
+    reach = [False] * (n + 1)
+    for start_idx in range(n, -1, -1):
+        if start_idx == n and complete:
+            reach[start_idx] = True
+            continue
+        node = trie.root
+        if start_idx == 0 and ctx.plain_pfx:
+            node = trie.find(ctx.plain_pfx) or {}
+        for end_idx in range(start_idx + 1, min(start_idx + trie.max_len, n) + 1):
+            node = node.get(text[end_idx - 1])
+            if node is None:
                 break
-            if word != prefix:
-                return True
-        return False
-    
-    # Keep track of already yielded partitions to avoid duplicates
-    yielded_partitions = set()
-    last_idx = safe_len(ctx.plain_pfx) + len(ctx.plaintext)
-    
+            if END in node and reach[end_idx]:
+                edges[start_idx].append(end_idx)
+        # a word prefix is shorter than the longest word
+        if n - start_idx < trie.max_len:
+            open_[start_idx] = trie.is_prefix(text[start_idx:])
+        reach[start_idx] = bool(edges[start_idx]) or open_[start_idx]
+
     def backtrack(start_idx, current_words):
-        # Base case: we've processed the entire input string
-        if start_idx == last_idx:
-            # We have a valid partition with only complete words, no prefix
-            words_to_yield = list(current_words) if current_words else None
-            partition = (tuple(current_words), None)
-            if partition not in yielded_partitions:
-                yielded_partitions.add(partition)
-                #all_plain_words.add(word for word in words_to_yield)
-                yield words_to_yield, None
+        if start_idx == n and complete:
+            yield list(current_words) if current_words else None, None
             return
-        
-        # Try to find full words starting at current position
-        for end_idx in range(start_idx + 1, len(ctx.plaintext) + 1):
-            current_substring = (ctx.plain_pfx or "") if start_idx == 0 else ""
-            current_substring += ctx.plaintext[start_idx:end_idx]
-            
-            # Check if the current substring is a valid word
-            if current_substring in words.set:
-                # Add this word to our current parts and continue
-                current_words.append(current_substring)
-                # Recurse to find more words
-                yield from backtrack(end_idx, current_words)
-                # Backtrack
-                current_words.pop()
-        
-        # Check if the remaining substring is a valid prefix
-        remaining = ctx.plaintext[start_idx:]
-        if is_prefix_of_word(remaining):
+        for end_idx in edges[start_idx]:
+            # the single word partition is yielded first
+            if start_idx == 0 and end_idx == n and complete:
+                continue
+            word = ctx.plain_pfx + text[:end_idx] if start_idx == 0 and ctx.plain_pfx else text[start_idx:end_idx]
+            current_words.append(word)
+            yield from backtrack(end_idx, current_words)
+            current_words.pop()
+        if open_[start_idx]:
             # If current_words is empty, yield None instead of an empty list
-            words_to_yield = list(current_words) if current_words else None
-            partition = (tuple(current_words), remaining)
-            if partition not in yielded_partitions:
-                yielded_partitions.add(partition)
-                yield words_to_yield, remaining
-    
+            yield list(current_words) if current_words else None, text[start_idx:]
+
     # Single word case (constraint a)
-    whole_word = (ctx.plain_pfx or "") + ctx.plaintext
+    whole_word = (ctx.plain_pfx or "") + text
     if whole_word in words.set:
-        partition = (tuple([whole_word]), None)
-        if partition not in yielded_partitions:
-            yielded_partitions.add(partition)
-            yield [whole_word], None
-    
-    # Start backtracking from the beginning of the string with no current words
-    yield from backtrack(0, [])
+        yield [whole_word], None
+
+    if reach[0]:
+        yield from backtrack(0, [])
 
 
 def is_empty_generator(gen):
@@ -186,11 +305,69 @@ def keyword_generator(ctx, md):
 def can_generate_keyword(ctx, md):
     return not is_empty_generator(keyword_generator(ctx, md))
 
-def contains_words_and_word_prefix(text, words):
-    ctx = Context(plaintext=text)
-    for _ in generate_words(ctx, words):
+def advance_segments(segments, text, trie):
+    """
+    Advance a segmentation state by text. A segmentation state is the list of
+    trie nodes for each open word that the text so far can end in, where the
+    root node means the text ends on a word boundary.
+    """
+    for c in text:
+        next_segments = []
+        boundary = False
+        for node in segments:
+            child = node.get(c)
+            if child is not None:
+                next_segments.append(child)
+                if END in child: boundary = True
+        if boundary:
+            next_segments.append(trie.root)
+        segments = next_segments
+        if not segments: break
+    return segments
+
+def is_feasible(segments):
+    # text is a sequence of words followed by a (possibly empty) word prefix
+    return any(is_prefix_node(node) for node in segments)
+
+@lru_cache(maxsize=FEASIBLE_CACHE_SIZE)
+def is_feasible_text(trie, text):
+    # True if text has at least one partition, as generate_words would
+    # yield, without enumerating them
+    if not text:
         return True
-    return False
+    return is_feasible(advance_segments([trie.root], text, trie))
+
+def native_trie(words):
+    trie = native_tries.get(words.trie, False)
+    if trie is False:
+        try:
+            trie = native.Trie(words.list)
+        except ValueError:
+            trie = None
+        native_tries[words.trie] = trie
+    return trie
+
+def contains_words_and_word_prefix(text, words):
+    if native is not None:
+        trie = native_trie(words)
+        if trie is not None:
+            return trie.feasible(text)
+    return is_feasible_text(words.trie, text)
+
+def native_mismatches(words, texts):
+    # The numbers of texts the native feasibility check, and the native
+    # decode with the texts reversed as keys, get a different answer for
+    # than the Python ones. Only a-z texts are checked for feasibility, as
+    # only decoded text is. A dictionary native.Trie rejects is an error
+    # here, since the search would quietly use the Python trie for it.
+    trie = native_trie(words)
+    if trie is None:
+        raise ValueError("native.Trie rejected the dictionary")
+    feasible = sum(trie.feasible(text) != is_feasible_text(words.trie, text)
+                   for text in texts if not text or is_letters(text))
+    decode = sum(native.decode(text, key) != beaufort_decrypt(text, key)
+                 for text, key in zip(texts, reversed(texts)))
+    return feasible, decode
 
 
 """
@@ -212,7 +389,7 @@ word: bonfire
 def test_generate_words_with_prefix(wordlist):
     prefix = "do"
     print(f"--{prefix}--")
-    for word in generate_words_with_prefix(wordlist, prefix):
+    for word in generate_words_with_prefix(make_words(wordlist), prefix):
         print(f"word: {word}")
 
     prefix = "bonfi"
@@ -220,7 +397,7 @@ def test_generate_words_with_prefix(wordlist):
     cipher_prefix = "xzfdq"
     wordlist = [ "balls", "boobs", "bonfire", "bucket" ]
     wordlist.sort()
-    for word in generate_words_with_prefix(wordlist, prefix):
+    for word in generate_words_with_prefix(make_words(wordlist), prefix):
         print(f"word: {word}")
 
 
@@ -234,14 +411,36 @@ def test_generate_words(words):
     sample_input = "applecatdog"
     
     print(f"Valid partitions for input '{sample_input}':")
-    for words, prefix in generate_words(sample_input, words):
+    for words, prefix in generate_words(Context(plaintext=sample_input), words):
         print(f"words: {words}, prefix: {prefix}")
 
 
+"""
+native: 1250 texts, 0 feasible mismatches, 0 decode mismatches
+"""
+def test_native(words):
+    # the native feasibility check and decode against the Python ones, on
+    # prefixes of word sequences, with and without a letter changed
+    from random import Random
+    rng = Random(0)
+    texts = []
+    for _ in range(250):
+        text = join(rng.choice(words.list) for _ in range(3))
+        changed = rng.randrange(len(text))
+        changed = text[:changed] + rng.choice("abcdefghijklmnopqrstuvwxyz") + text[changed + 1:]
+        for n in range(0, len(text) + 1, 3):
+            texts.extend((text[:n], changed[:n]))
+    texts = texts[:1250]
+    feasible, decode = native_mismatches(words, texts)
+    print(f"native: {len(texts)} texts, {feasible} feasible mismatches, {decode} decode mismatches")
+    assert (feasible, decode) == (0, 0)
+
 # Example usage:
 if __name__ == "__main__":
     wordlist = ["cat", "apple", "cats", "do", "dog", "dogmeat", "go", "good"]
     wordlist.sort()
     test_generate_words_with_prefix(wordlist)
-    words = Words(set=set(wordlist), list=wordlist)
+    words = make_words(wordlist)
     test_generate_words(words)
+    if native is not None:
+        test_native(make_words(sorted(wordlist + ["café", "cafés", "écarté"])))
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+# Tables of the words a search has seen, for --show-words: the key words
+# with the ciphers they decoded, and the plaintext words with the prefixes
+# that followed them. Words and values are interned to ids, and the table
+# counts how often each (word, value) pair was seen.
+#
+# With a capacity the table keeps about the capacity most frequent pairs,
+# as in Space-Saving: once it has twice capacity pairs, the least frequent
+# are dropped down to capacity, and new pairs start from the highest count
+# dropped so far (floor), so kept counts are upper bounds.
+
+Entry = namedtuple('Entry', ['word', 'value', 'count'])
+
+class WordTable:
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self.ids = {}    # word or value -> id
+        self.names = []  # id -> word or value
+        self.counts = {} # word id -> {value id: count}
+        self.size = 0
+        self.floor = 0
+
+    def intern(self, name):
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+    def add(self, word, value, count=1):
+        word_id = self.intern(word)
+        values = self.counts.get(word_id)
+        if values is None:
+            values = self.counts[word_id] = {}
+        value_id = self.intern(value)
+        if value_id in values:
+            values[value_id] += count
+            return
+        values[value_id] = self.floor + count
+        self.size += 1
+        if self.capacity and self.size >= 2 * self.capacity:
+            self.prune()
+
+    def prune(self):
+        # keep the capacity most frequent pairs, and re-intern their names
+        # so dropped names are freed too
+        entries = sorted(self.entries(), key=lambda entry: entry.count, reverse=True)
+        self.floor = max(self.floor, entries[self.capacity].count)
+        floor = self.floor
+        self.clear()
+        self.floor = floor
+        for entry in entries[:self.capacity]:
+            values = self.counts.setdefault(self.intern(entry.word), {})
+            values[self.intern(entry.value)] = entry.count
+            self.size += 1
+
+    def entries(self):
+        for word_id, values in self.counts.items():
+            word = self.names[word_id]
+            for value_id, count in values.items():
+                yield Entry(word, self.names[value_id], count)
+
+    def words(self):
+        # (word, {value: count}) in word order
+        for word_id in sorted(self.counts, key=self.names.__getitem__):
+            yield self.names[word_id], {self.names[value_id]: count
+                                        for value_id, count in self.counts[word_id].items()}
+
+    def merge(self, other):
+        for entry in other.entries():
+            self.add(*entry)
+
+    def to_dict(self):
+        return {'floor': self.floor, 'entries': [list(entry) for entry in self.entries()]}
+
+    def update(self, data):
+        # add the entries of a to_dict
+        for entry in data.get('entries', []):
+            self.add(*entry)
+        self.floor = max(self.floor, data.get('floor', 0))